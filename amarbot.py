@@ -1,19 +1,40 @@
 import argparse
 import asyncio
+import multiprocessing
 import os
+import sys
+from typing import List
 
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
-from lib.cogs.ack import AcknowledgeCog
-from lib.cogs.memes import MemeCog
-from lib.cogs.music import MusicCog
-from lib.cogs.quotes import QuotesCog
-from lib.cogs.reminders import RemindersCog
-from lib.cogs.sync import SyncCog
-from lib.cogs.utils import UtilsCog
-from lib.logging import get_logger, setup_discord_logging
+from lib.dispatch import get_dispatcher
+from lib.extensions import import_extension, set_options
+from lib.gateway import describe, gateway_options
+from lib.logging import get_logger, setup_discord_logging, setup_logging
+from lib.runtime import (
+    DIAGNOSTICS,
+    MODES,
+    PRODUCTION,
+    SlowCallbackMonitor,
+    install_uvloop,
+)
+from lib.sharding import Supervisor, recommended_shard_count
+from lib.startup import StartupProfiler
+
+# cogs are only imported if they're enabled, some of them are slow to import
+COGS = {
+    "admin": ("lib.cogs.admin", "AdminCog"),
+    "sync": ("lib.cogs.sync", "SyncCog"),
+    "metrics": ("lib.cogs.metrics", "MetricsCog"),
+    "ack": ("lib.cogs.ack", "AcknowledgeCog"),
+    "memes": ("lib.cogs.memes", "MemeCog"),
+    "music": ("lib.cogs.music", "MusicCog"),
+    "qod": ("lib.cogs.quotes", "QuotesCog"),
+    "reminders": ("lib.cogs.reminders", "RemindersCog"),
+    "utils": ("lib.cogs.utils", "UtilsCog"),
+}
 
 
 def parse_args():
@@ -30,6 +51,13 @@ def parse_args():
         help="disable emoji acknowledgments (bot responding to commands with emojis)",
         default=False,
     )
+    parser.add_argument(
+        "--ack_delay",
+        type=float,
+        help="only acknowledge commands still running after this many seconds, "
+        "fast commands just get the final reaction (0 acknowledges every command)",
+        default=0.5,
+    )
     parser.add_argument(
         "--no_memes",
         action="store_true",
@@ -60,55 +88,199 @@ def parse_args():
         help="disable utils-related commands",
         default=False,
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=MODES,
+        help="production runs the event loop without asyncio's debug mode, "
+        "diagnostics keeps it on and reports slow callbacks",
+        default=PRODUCTION,
+    )
+    parser.add_argument(
+        "--uvloop",
+        action="store_true",
+        help="use uvloop's event loop, if it's installed (production mode only)",
+        default=False,
+    )
+    parser.add_argument(
+        "--slow_callback_threshold",
+        type=float,
+        help="callbacks blocking the event loop for longer than this many seconds "
+        "get reported (diagnostics mode only)",
+        default=0.1,
+    )
+    parser.add_argument(
+        "--slow_callback_report_interval",
+        type=float,
+        help="how often to report slow callbacks, in seconds (diagnostics mode only)",
+        default=60,
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        help="serve Prometheus metrics on http://127.0.0.1:{port}/metrics (disabled "
+        "by default)",
+        default=0,
+    )
+    parser.add_argument(
+        "--profile_startup",
+        action="store_true",
+        help="log how long each cog took to import and initialize (initializes "
+        "cogs one at a time)",
+        default=False,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="run the bot sharded, in this many worker processes (e.g. one per core), "
+        "restarting any that crash (disabled by default)",
+        default=0,
+    )
+    parser.add_argument(
+        "--shard_count",
+        type=int,
+        help="total number of shards when sharded (defaults to Discord's "
+        "recommendation)",
+        default=0,
+    )
+    parser.add_argument(
+        "--shard_ids",
+        type=lambda value: [int(shard_id) for shard_id in value.split(",")],
+        help="comma separated shards to run in this process, out of --shard_count "
+        "(set by the supervisor for its workers)",
+        default=None,
+    )
+    parser.add_argument(
+        "--worker",
+        type=int,
+        help="index of this worker process (set by the supervisor)",
+        default=0,
+    )
+    args = parser.parse_args()
+    if args.shard_ids is not None and not args.shard_count:
+        parser.error("--shard_ids needs --shard_count")
+    return args
 
 
 async def main(
     command_prefix: str,
     no_ack: bool = False,
+    ack_delay: float = 0.5,
     no_memes: bool = False,
     no_music: bool = False,
     no_qod: bool = False,
     no_reminders: bool = False,
     no_utils: bool = False,
+    mode: str = PRODUCTION,
+    slow_callback_threshold: float = 0.1,
+    slow_callback_report_interval: float = 60,
+    metrics_port: int = 0,
+    profile_startup: bool = False,
+    shard_ids: List[int] | None = None,
+    shard_count: int = 0,
+    worker: int = 0,
 ):
-    logger = get_logger("amarbot")
-    logger.info("Starting AmarBot...")
+    profiler = StartupProfiler()
+
+    if shard_ids is not None:
+        # tells apart the workers' log records (see `JsonLogsFormatter`)
+        multiprocessing.current_process().name = f"worker-{worker}"
 
+    # picks up logging settings from the .env file
+    setup_logging()
     setup_discord_logging()
 
-    intents = discord.Intents.default()
-    intents.message_content = True
+    logger = get_logger("amarbot")
+    logger.info(f"Starting AmarBot in {mode} mode...")
+    if shard_ids is not None:
+        logger.info(f"Running shards {shard_ids} of {shard_count}")
+
+    if mode == DIAGNOSTICS:
+        slow_callbacks = SlowCallbackMonitor(
+            slow_callback_threshold, slow_callback_report_interval
+        )
+        slow_callbacks.start()
+
+    enabled = {
+        "admin": True,
+        "sync": True,
+        "metrics": bool(metrics_port),
+        "ack": not no_ack,
+        "memes": not no_memes,
+        "music": not no_music,
+        "qod": not no_qod,
+        "reminders": not no_reminders,
+        "utils": not no_utils,
+    }
+    cog_kwargs = {
+        # every worker needs a port of its own
+        "metrics": {"port": metrics_port + worker},
+        "ack": {"ack_delay": ack_delay},
+    }
+
+    # the classes are needed up front, for the gateway intents they declare
+    cog_classes = {}
+    for name, (module_name, class_name) in COGS.items():
+        if enabled[name]:
+            with profiler.measure(name, "import"):
+                module = import_extension(module_name)
+            cog_classes[name] = getattr(module, class_name)
+            set_options(module_name, **cog_kwargs.get(name, {}))
+
+    gateway = gateway_options(cog_classes.values())
+    logger.info(f"Gateway {describe(gateway)}")
 
-    bot = commands.Bot(
+    bot_options = dict(
         command_prefix=command_prefix,
-        intents=intents,
+        **gateway,
         activity=discord.Activity(
             type=discord.ActivityType.listening, name=f"{command_prefix}help"
         ),
     )
+    if shard_ids is not None:
+        bot = commands.AutoShardedBot(
+            shard_ids=shard_ids, shard_count=shard_count, **bot_options
+        )
+    else:
+        bot = commands.Bot(**bot_options)
 
     @bot.event
     async def on_ready():
         logger.info(f"Logged in as {bot.user.name} (ID: {bot.user.id})")
 
-    async with bot:
-        await bot.add_cog(SyncCog(bot))
+    async def load_cog(name: str):
+        # cogs are loaded as extensions, so they can be reloaded (see `AdminCog`)
+        with profiler.measure(name, "init"):
+            await bot.load_extension(COGS[name][0])
 
-        if not no_ack:
-            await bot.add_cog(AcknowledgeCog(bot))
-        if not no_memes:
-            await bot.add_cog(MemeCog(bot))
-        if not no_music:
-            await bot.add_cog(MusicCog(bot))
-        if not no_qod:
-            await bot.add_cog(QuotesCog(bot))
-        if not no_reminders:
-            await bot.add_cog(RemindersCog(bot))
-        if not no_utils:
-            await bot.add_cog(UtilsCog(bot))
+    try:
+        async with bot:
+            if profile_startup:
+                # one at a time, so each cog's init time is its own rather than
+                # overlapping with the others'
+                for name in cog_classes:
+                    await load_cog(name)
+            else:
+                # cogs load concurrently, so their slow initialization (imports,
+                # reading files, connecting to Firestore) overlaps
+                await asyncio.gather(*[load_cog(name) for name in cog_classes])
 
-        await bot.start(os.environ.get("AMARBOT_TOKEN"))
+            if profile_startup:
+                logger.info(f"Startup profile:\n{profiler.report()}")
+
+            await bot.start(os.environ.get("AMARBOT_TOKEN"))
+    finally:
+        # the bot is closed, so whatever is still queued can't go out anymore
+        get_dispatcher().shutdown()
+
+
+async def supervise(workers: int, shard_count: int = 0):
+    """Runs the bot in `workers` processes, see `Supervisor`."""
+    setup_logging()
+    if not shard_count:
+        shard_count = await recommended_shard_count(os.environ.get("AMARBOT_TOKEN"))
+    # workers get the same arguments as the supervisor, plus their shards
+    await Supervisor(sys.argv, shard_count, workers).run()
 
 
 if __name__ == "__main__":
@@ -116,15 +288,36 @@ if __name__ == "__main__":
 
     load_dotenv()
 
+    if args.workers and args.shard_ids is None:
+        asyncio.run(supervise(args.workers, args.shard_count))
+        sys.exit()
+
+    if args.uvloop:
+        if args.mode == PRODUCTION:
+            install_uvloop()
+        else:
+            get_logger("amarbot").warning(
+                "Ignoring --uvloop, it's only used in production mode"
+            )
+
     asyncio.run(
         main(
             command_prefix=args.command_prefix,
             no_ack=args.no_ack,
+            ack_delay=args.ack_delay,
             no_memes=args.no_memes,
             no_music=args.no_music,
             no_qod=args.no_qod,
             no_reminders=args.no_reminders,
             no_utils=args.no_utils,
+            mode=args.mode,
+            slow_callback_threshold=args.slow_callback_threshold,
+            slow_callback_report_interval=args.slow_callback_report_interval,
+            metrics_port=args.metrics_port,
+            profile_startup=args.profile_startup,
+            shard_ids=args.shard_ids,
+            shard_count=args.shard_count,
+            worker=args.worker,
         ),
-        debug=True,
+        debug=args.mode == DIAGNOSTICS,
     )
@@ -0,0 +1,38 @@
+"""Helpers shared by the benchmarks."""
+import math
+import resource
+from typing import List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (`pct` in 0-100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_ms(name: str, values: List[float]) -> str:
+    """Formats p50/p99/max of a list of durations (in seconds) as milliseconds."""
+    return (
+        f"{name}: p50={percentile(values, 50) * 1000:.2f}ms "
+        f"p99={percentile(values, 99) * 1000:.2f}ms "
+        f"max={max(values, default=float('nan')) * 1000:.2f}ms"
+    )
+
+
+def cpu_time() -> float:
+    """User + system CPU time of this process, in seconds."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (peak, where /proc isn't there)."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # kilobytes on Linux, bytes on macOS, close enough for a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,111 @@
+"""A local stand-in for the They Said So API, so the quote pipeline can be exercised
+without network access or an API token. Point the bot at it with
+`THEYSAIDSO_BASE_URL=http://127.0.0.1:8080`.
+
+Usage:
+    python -m benchmarks.fake_quotes --latency 0.2 --error_rate 0.1 --rate_limit 5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+QUOTE = {
+    "quote": "It always seems impossible until it's done.",
+    "author": "Nelson Mandela",
+}
+
+
+def create_app(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limit: int = 0,
+) -> web.Application:
+    """Creates the fake API app.
+
+    Every response is delayed by `latency` (+ up to `jitter`) seconds, a fraction of
+    `error_rate` requests fail with a 503, and if `rate_limit` is set, requests
+    beyond that many per second get a 429 with a `Retry-After` header.
+    """
+    window = {"second": 0, "requests": 0}
+
+    async def qod(request: web.Request):
+        app["requests"] += 1
+
+        now = int(time.monotonic())
+        if window["second"] != now:
+            window["second"] = now
+            window["requests"] = 0
+        window["requests"] += 1
+
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        if rate_limit and window["requests"] > rate_limit:
+            return web.json_response(
+                {"error": {"code": 429, "message": "Too Many Requests"}},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        if random.random() < error_rate:
+            return web.json_response(
+                {"error": {"code": 503, "message": "Service Unavailable"}}, status=503
+            )
+
+        return web.json_response(
+            {
+                "success": {"total": 1},
+                "contents": {
+                    "quotes": [
+                        {**QUOTE, "category": request.query.get("category", "inspire")}
+                    ]
+                },
+            }
+        )
+
+    app = web.Application()
+    app["requests"] = 0
+    app.router.add_get("/qod.json", qod)
+    return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """Starts the fake API in the current event loop. Returns the runner (call
+    `runner.cleanup()` to stop it) and the base URL it's listening on.
+    """
+    runner = web.AppRunner(create_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="random extra latency, in seconds"
+    )
+    parser.add_argument(
+        "--error_rate", type=float, default=0.0, help="fraction of requests to 503"
+    )
+    parser.add_argument(
+        "--rate_limit", type=int, default=0, help="requests per second before 429s"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    web.run_app(
+        create_app(args.latency, args.jitter, args.error_rate, args.rate_limit),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,114 @@
+"""Benchmarks event loop throughput in each runtime mode (see `lib/runtime.py`):
+production (no asyncio debug), production with uvloop (if installed) and
+diagnostics (asyncio debug with slow callback reporting).
+
+Measures plain callbacks (`call_soon`), task creation and a ping-pong between two
+tasks over an `asyncio.Queue`, which is what most of the bot's work looks like.
+
+Usage:
+    python -m benchmarks.loop --iterations 200000
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+from lib.runtime import DIAGNOSTICS, PRODUCTION, SlowCallbackMonitor
+
+
+async def bench_callbacks(iterations: int) -> float:
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    remaining = iterations
+
+    def callback():
+        nonlocal remaining
+        remaining -= 1
+        if remaining:
+            loop.call_soon(callback)
+        else:
+            done.set_result(None)
+
+    start = perf_counter()
+    loop.call_soon(callback)
+    await done
+    return iterations / (perf_counter() - start)
+
+
+async def bench_tasks(iterations: int) -> float:
+    async def noop():
+        pass
+
+    start = perf_counter()
+    batch = 1000
+    for _ in range(iterations // batch):
+        await asyncio.gather(*[noop() for _ in range(batch)])
+    return iterations / (perf_counter() - start)
+
+
+async def bench_ping_pong(iterations: int) -> float:
+    ping, pong = asyncio.Queue(), asyncio.Queue()
+
+    async def responder():
+        for _ in range(iterations):
+            await pong.put(await ping.get())
+
+    start = perf_counter()
+    task = asyncio.create_task(responder())
+    for index in range(iterations):
+        await ping.put(index)
+        await pong.get()
+    await task
+    return iterations / (perf_counter() - start)
+
+
+async def run_benchmarks(mode: str, iterations: int) -> dict:
+    monitor = None
+    if mode == DIAGNOSTICS:
+        monitor = SlowCallbackMonitor(report_interval=3600)
+        monitor.start()
+
+    results = {
+        "callbacks/s": await bench_callbacks(iterations),
+        "tasks/s": await bench_tasks(iterations // 10),
+        "ping-pongs/s": await bench_ping_pong(iterations // 10),
+    }
+
+    if monitor:
+        monitor.stop()
+    return results
+
+
+def run_mode(name: str, iterations: int):
+    if name == "production+uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            print(f"{name}: skipped, uvloop isn't installed")
+            return
+        loop = uvloop.new_event_loop()
+    else:
+        loop = asyncio.new_event_loop()
+
+    mode = DIAGNOSTICS if name == DIAGNOSTICS else PRODUCTION
+    loop.set_debug(mode == DIAGNOSTICS)
+    try:
+        results = loop.run_until_complete(run_benchmarks(mode, iterations))
+    finally:
+        loop.close()
+
+    print(
+        f"{name}: "
+        + " ".join(f"{metric}={value:,.0f}" for metric, value in results.items())
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for name in [PRODUCTION, "production+uvloop", DIAGNOSTICS]:
+        run_mode(name, args.iterations)
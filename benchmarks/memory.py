@@ -0,0 +1,236 @@
+"""Benchmarks the resident memory of the gateway cache under each deployment's
+intents and caches (see `lib/gateway.py`), against the previous configuration
+(`Intents.default()` plus `message_content`, with discord.py's default caches).
+
+Each configuration runs in a fresh process, which feeds simulated guilds (channels,
+roles, emojis, members in voice) and message traffic into discord.py's connection
+state, the same way gateway events would, leaving out whatever Discord wouldn't
+send without the intent. Runs fully offline.
+
+Usage:
+    python -m benchmarks.memory --guilds 1000,5000 --messages 20000
+"""
+import argparse
+import gc
+import importlib
+import json
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+import discord
+from discord.ext import commands
+
+from benchmarks.common import rss_bytes
+from lib.gateway import gateway_options
+
+BOT_ID = 1 << 40
+
+# configuration -> enabled cogs, see `COGS` in amarbot.py
+DEPLOYMENTS = {
+    "all cogs": ["sync", "ack", "memes", "music", "qod", "reminders", "utils"],
+    "music only": ["sync", "music"],
+    "reminders only": ["sync", "reminders"],
+    "qod only": ["sync", "qod"],
+    "utils only": ["sync", "utils"],
+}
+
+
+def previous_options() -> Dict[str, Any]:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    return {"intents": intents}
+
+
+def deployment_options(cogs: List[str]) -> Dict[str, Any]:
+    from amarbot import COGS
+
+    classes = []
+    for name in cogs:
+        module_name, class_name = COGS[name]
+        classes.append(getattr(importlib.import_module(module_name), class_name))
+    return gateway_options(classes)
+
+
+def fake_guild(guild_id: int, intents: discord.Intents, voice_members: int) -> dict:
+    def snowflake(index: int) -> str:
+        return str(guild_id * 1000 + index)
+
+    def user(index: int) -> dict:
+        return {
+            "id": snowflake(index),
+            "username": f"user{index}",
+            "discriminator": "0",
+            "avatar": None,
+        }
+
+    def member(user: dict) -> dict:
+        return {
+            "user": user,
+            "roles": [],
+            "flags": 0,
+            "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False,
+            "mute": False,
+        }
+
+    voice_channel = snowflake(101)
+    data = {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "owner_id": snowflake(0),
+        "member_count": 200,
+        "roles": [
+            {"id": snowflake(200 + index), "name": f"role {index}", "permissions": "0"}
+            for index in range(20)
+        ],
+        "emojis": [
+            {"id": snowflake(300 + index), "name": f"emoji{index}"}
+            for index in range(30)
+        ],
+        "channels": [
+            {"id": snowflake(index), "type": 0, "name": f"text {index}", "position": 0}
+            for index in range(1, 11)
+        ]
+        + [
+            {
+                "id": snowflake(100 + index),
+                "type": 2,
+                "name": f"voice {index}",
+                "position": 0,
+                "bitrate": 64000,
+                "user_limit": 0,
+            }
+            for index in range(1, 4)
+        ],
+        # without the members intent, only the bot itself and members in voice
+        "members": [member({**user(0), "id": str(BOT_ID)})],
+    }
+    if intents.voice_states:
+        data["voice_states"] = [
+            {"user_id": snowflake(500 + index), "channel_id": voice_channel}
+            for index in range(voice_members)
+        ]
+        data["members"] += [member(user(500 + index)) for index in range(voice_members)]
+    return data
+
+
+def fake_message(index: int, guild_id: int, intents: discord.Intents) -> dict:
+    return {
+        "id": str(index + 1),
+        "channel_id": str(guild_id * 1000 + 1 + index % 10),
+        "guild_id": str(guild_id),
+        "author": {
+            "id": str(index),
+            "username": "someone",
+            "discriminator": "0",
+            "avatar": None,
+        },
+        "member": {"roles": [], "flags": 0, "joined_at": "2024-01-01T00:00:00+00:00"},
+        # Discord leaves out the content without the message content intent
+        "content": "some chatter " * 8 if intents.message_content else "",
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def measure(config: str, guilds: int, messages: int, voice_members: int) -> dict:
+    if config == "previous":
+        options = previous_options()
+    else:
+        options = deployment_options(DEPLOYMENTS[config])
+
+    bot = commands.Bot(command_prefix="!", **options)
+    state = bot._connection
+    state.user = discord.ClientUser(
+        state=state,
+        data={"id": BOT_ID, "username": "amarbot", "discriminator": "0", "avatar": None},
+    )
+    intents = state._intents
+
+    gc.collect()
+    baseline = rss_bytes()
+
+    for index in range(guilds):
+        state._add_guild_from_data(fake_guild(index + 1, intents, voice_members))
+
+    # what `ConnectionState.parse_message_create` does, minus dispatching
+    if intents.guild_messages:
+        for index in range(messages):
+            data = fake_message(index, index % guilds + 1, intents)
+            channel, _ = state._get_guild_channel(data)
+            message = discord.Message(channel=channel, data=data, state=state)
+            if state._messages is not None:
+                state._messages.append(message)
+
+    gc.collect()
+    used = rss_bytes() - baseline
+    return {
+        "config": config,
+        "guilds": guilds,
+        "rss_per_1k_guilds": used / guilds * 1000,
+        "cached_messages": len(state._messages or ()),
+        "cached_members": sum(len(guild._members) for guild in state.guilds),
+        "voice_states": sum(len(guild._voice_states) for guild in state.guilds),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--guilds",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[1000, 5000],
+    )
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--voice_members", type=int, default=3)
+    # runs a single configuration, in the current process
+    parser.add_argument("--config", type=str, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.config:
+        result = measure(args.config, args.guilds[0], args.messages, args.voice_members)
+        print(json.dumps(result))
+        sys.exit()
+
+    for guilds in args.guilds:
+        print(f"{guilds} guilds, {args.messages} messages:")
+        for config in ["previous", *DEPLOYMENTS]:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.memory",
+                    "--config",
+                    config,
+                    "--guilds",
+                    str(guilds),
+                    "--messages",
+                    str(args.messages),
+                    "--voice_members",
+                    str(args.voice_members),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(
+                f"  {config:<15}"
+                f"{result['rss_per_1k_guilds'] / 2**20:>8.2f} MiB per 1k guilds  "
+                f"messages={result['cached_messages']} "
+                f"members={result['cached_members']} "
+                f"voice_states={result['voice_states']}"
+            )
@@ -0,0 +1,272 @@
+"""Benchmarks the music pipeline (`MusicController` + `YTDLSource` + ffmpeg) against
+simulated guilds, without joining a real voice channel. Runs fully offline.
+
+A fake voice client reads each guild's audio source every 20ms from its own thread,
+the same way discord.py's `AudioPlayer` does, and youtube_dl extraction is replaced
+with a stub pointing at a generated track served over local HTTP (so ffmpeg still
+takes the streaming path). Needs `ffmpeg` on the PATH.
+
+Usage:
+    python -m benchmarks.music --guilds 1,10,100 --tracks 3 --duration 10
+"""
+import argparse
+import asyncio
+import math
+import resource
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import wave
+from types import SimpleNamespace
+from typing import List
+
+import discord
+from aiohttp import web
+
+import lib.ytdl
+from benchmarks.common import cpu_time, summarize_ms
+from lib.cogs.music import MusicController
+from lib.ffmpeg import FFmpegGovernor
+from lib.ytdl import YTDLSource
+
+# discord.py's `AudioPlayer.DELAY`, sources are read every 20ms
+FRAME_DELAY = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class FakeVoiceClient:
+    """Consumes an `AudioSource` in real time from its own thread, like discord.py's
+    `AudioPlayer`, recording when every frame was read.
+    """
+
+    def __init__(self, channel) -> None:
+        self.channel = channel
+        self.source: discord.AudioSource | None = None
+        # (first frame read at, last frame read at) of every played source
+        self.tracks: List[List[float]] = []
+        # how late every frame read was, relative to its 20ms schedule
+        self.lateness: List[float] = []
+
+        self._thread: threading.Thread | None = None
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+
+    def play(self, source: discord.AudioSource, *, after=None):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+
+        self.source = source
+        self._end.clear()
+        self._resumed.set()
+        self._thread = threading.Thread(target=self._run, args=(source, after))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, source: discord.AudioSource, after):
+        track = None
+        loops = 0
+        start = time.perf_counter()
+        error = None
+        try:
+            while not self._end.is_set():
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    loops = 0
+                    start = time.perf_counter()
+                    continue
+
+                loops += 1
+                data = source.read()
+                now = time.perf_counter()
+                if not data:
+                    break
+
+                self.lateness.append(now - (start + FRAME_DELAY * (loops - 1)))
+                if track is None:
+                    track = [now, now]
+                    self.tracks.append(track)
+                track[1] = now
+
+                next_time = start + FRAME_DELAY * loops
+                time.sleep(max(0, next_time - time.perf_counter()))
+        except Exception as e:
+            error = e
+        finally:
+            self.source = None
+            if after is not None:
+                after(error)
+            source.cleanup()
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def is_playing(self) -> bool:
+        return (
+            self._thread is not None
+            and self._thread.is_alive()
+            and self._resumed.is_set()
+            and not self._end.is_set()
+        )
+
+    def is_paused(self) -> bool:
+        return self._thread is not None and not self._resumed.is_set()
+
+
+class FakeTextChannel:
+    def __init__(self, id: int) -> None:
+        self.id = id
+
+    async def send(self, content: str):
+        pass
+
+
+def write_track(path: str, duration: float):
+    """Writes a 48KHz 16-bit stereo sine tone, the format discord.py plays."""
+    frames = bytearray()
+    for index in range(int(48000 * duration)):
+        sample = int(8000 * math.sin(2 * math.pi * 440 * index / 48000))
+        frames += struct.pack("<hh", sample, sample)
+
+    with wave.open(path, "wb") as file:
+        file.setnchannels(2)
+        file.setsampwidth(2)
+        file.setframerate(48000)
+        file.writeframes(bytes(frames))
+
+
+async def start_track_server(directory: str):
+    app = web.Application()
+    app.router.add_static("/", directory)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def stub_extraction(track_url: str, latency: float):
+    async def extract(cls, url, *, loop=None, stream=False) -> dict:
+        await asyncio.sleep(latency)
+        return {"id": url, "title": url, "url": track_url, "webpage_url": url}
+
+    YTDLSource.extract = classmethod(extract)
+
+
+async def run_guilds(count: int, args) -> dict:
+    loop = asyncio.get_running_loop()
+    controllers = []
+    for index in range(count):
+        voice_client = FakeVoiceClient(SimpleNamespace(id=index + 1))
+        guild = SimpleNamespace(id=index + 1, voice_client=voice_client)
+        controller = MusicController(loop, guild)
+        controller.update_channels(FakeTextChannel(index + 1), voice_client.channel)
+        controllers.append(controller)
+
+    cpu_start = cpu_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+
+    for controller in controllers:
+        for track in range(args.tracks):
+            controller.push(f"track-{track}")
+        controller.play()
+
+    deadline = start + args.tracks * (args.duration + 10) + 30
+    while any(controller.queue for controller in controllers):
+        if time.perf_counter() > deadline:
+            print("timed out waiting for playback to finish")
+            break
+        await asyncio.sleep(0.1)
+
+    wall = time.perf_counter() - start
+    cpu = cpu_time() - cpu_start
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ffmpeg_cpu = (children_after.ru_utime + children_after.ru_stime) - (
+        children.ru_utime + children.ru_stime
+    )
+
+    startup, gaps, lateness = [], [], []
+    for controller in controllers:
+        controller.shutdown()
+        voice_client = controller.guild.voice_client
+        if voice_client.tracks:
+            startup.append(voice_client.tracks[0][0] - start)
+        for previous, track in zip(voice_client.tracks, voice_client.tracks[1:]):
+            gaps.append(track[0] - previous[1])
+        lateness.extend(voice_client.lateness)
+
+    return {
+        "startup": startup,
+        "gaps": gaps,
+        "lateness": lateness,
+        "played": sum(len(c.guild.voice_client.tracks) for c in controllers),
+        "wall": wall,
+        "cpu": cpu,
+        "ffmpeg_cpu": ffmpeg_cpu,
+    }
+
+
+async def run(args):
+    if shutil.which("ffmpeg") is None:
+        raise SystemExit("ffmpeg not found on the PATH")
+
+    tmp_dir = tempfile.mkdtemp()
+    write_track(f"{tmp_dir}/track.wav", args.duration)
+    runner, base_url = await start_track_server(tmp_dir)
+    stub_extraction(f"{base_url}/track.wav", args.extract_latency)
+
+    for count in [int(count) for count in args.guilds.split(",")]:
+        # a fresh governor per run, sized so it doesn't throttle the benchmark
+        lib.ytdl.governor = FFmpegGovernor(max_processes=args.max_ffmpeg or count * 2)
+        results = await run_guilds(count, args)
+
+        streams = count * results["wall"]
+        print(f"guilds={count} tracks={args.tracks} duration={args.duration}s")
+        print(f"played: {results['played']}/{count * args.tracks}")
+        print(summarize_ms("startup latency", results["startup"]))
+        print(summarize_ms("inter-track gap", results["gaps"]))
+        print(summarize_ms("frame read jitter", results["lateness"]))
+        print(
+            f"cpu per stream: bot={100 * results['cpu'] / streams:.2f}% "
+            f"ffmpeg={100 * results['ffmpeg_cpu'] / streams:.2f}% of a core"
+        )
+        print()
+
+    await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--guilds", type=str, default="1,10,100", help="comma separated guild counts"
+    )
+    parser.add_argument("--tracks", type=int, default=3, help="tracks per guild")
+    parser.add_argument(
+        "--duration", type=float, default=10, help="track duration, in seconds"
+    )
+    parser.add_argument(
+        "--extract_latency",
+        type=float,
+        default=0.5,
+        help="seconds the stubbed youtube_dl extraction takes",
+    )
+    parser.add_argument(
+        "--max_ffmpeg",
+        type=int,
+        default=0,
+        help="ffmpeg process cap (defaults to 2 per guild)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
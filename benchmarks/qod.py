@@ -0,0 +1,143 @@
+"""Benchmarks the quote of the day pipeline (`QuotesCog.qod`) against thousands of
+simulated guilds, using the local fake They Said So API. Runs fully offline.
+
+Usage:
+    python -m benchmarks.qod --guilds 5000 --send_latency 0.05
+    python -m benchmarks.qod --guilds 5000 --api_rate_limit 1 --api_error_rate 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Dict, List
+
+import discord
+from discord import ChannelType
+
+from benchmarks.common import cpu_time, summarize_ms
+from benchmarks.fake_quotes import start_server
+from lib.cogs.quotes import QuotesCog
+
+
+class FakeChannel:
+    def __init__(
+        self, id: int, name: str, guild, latency: float, failure_rate: float
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.guild = guild
+        self.type = ChannelType.text
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent_at: float | None = None
+
+    async def send(self, content: str):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.failure_rate:
+            raise discord.HTTPException(
+                SimpleNamespace(status=500, reason="Internal Server Error"), "fake"
+            )
+        self.sent_at = perf_counter()
+
+
+class FakeBot:
+    def __init__(self, guilds: List[SimpleNamespace]) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.guilds = guilds
+        self._channels: Dict[int, FakeChannel] = {
+            channel.id: channel for guild in guilds for channel in guild.channels
+        }
+
+    def get_channel(self, id: int):
+        return self._channels.get(id)
+
+    def is_ready(self):
+        return True
+
+
+def make_guilds(count: int, channels_per_guild: int, **channel_kwargs):
+    guilds = []
+    next_id = 1
+    for index in range(count):
+        guild = SimpleNamespace(id=next_id, name=f"guild-{index}", channels=[])
+        next_id += 1
+        # every guild has one quote of the day channel among its other channels
+        for channel_index in range(channels_per_guild):
+            name = "quote-of-the-day" if channel_index == 0 else f"general-{channel_index}"
+            guild.channels.append(FakeChannel(next_id, name, guild, **channel_kwargs))
+            next_id += 1
+        guilds.append(guild)
+    return guilds
+
+
+async def run(args):
+    runner, base_url = await start_server(
+        latency=args.api_latency,
+        jitter=args.api_jitter,
+        error_rate=args.api_error_rate,
+        rate_limit=args.api_rate_limit,
+    )
+    # set before the cog is created, it reads them in `__init__`
+    os.environ["THEYSAIDSO_BASE_URL"] = base_url
+    os.environ.setdefault("THEYSAIDSO_API_TOKEN", "fake")
+
+    guilds = make_guilds(
+        args.guilds,
+        args.channels,
+        latency=args.send_latency,
+        failure_rate=args.send_failure_rate,
+    )
+    bot = FakeBot(guilds)
+
+    cog = QuotesCog(bot)
+    cog.max_concurrent_sends = args.concurrency
+    await cog.cog_load()
+
+    start = perf_counter()
+    await cog.on_ready()
+    index_duration = perf_counter() - start
+
+    cpu_start = cpu_time()
+    start = perf_counter()
+    await cog.qod()
+    duration = perf_counter() - start
+    cpu = cpu_time() - cpu_start
+
+    latencies = [
+        channel.sent_at - start
+        for guild in guilds
+        for channel in guild.channels
+        if channel.sent_at is not None
+    ]
+
+    await cog.cog_unload()
+    await runner.cleanup()
+
+    print(f"guilds={args.guilds} concurrency={args.concurrency}")
+    print(f"index build: {index_duration * 1000:.2f}ms")
+    print(f"qod total: {duration:.2f}s, cpu: {cpu:.2f}s")
+    print(f"delivered: {len(latencies)}/{args.guilds}")
+    print(f"throughput: {len(latencies) / duration:.1f} sends/s")
+    print(summarize_ms("delivery latency", latencies))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=20, help="channels per guild")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--send_latency", type=float, default=0.05)
+    parser.add_argument("--send_failure_rate", type=float, default=0.0)
+    parser.add_argument("--api_latency", type=float, default=0.1)
+    parser.add_argument("--api_jitter", type=float, default=0.0)
+    parser.add_argument("--api_error_rate", type=float, default=0.0)
+    parser.add_argument(
+        "--api_rate_limit", type=int, default=0, help="requests per second before 429s"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,126 @@
+import audioop
+from typing import List, Tuple
+
+import discord
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+# 20ms of 16-bit 48KHz stereo PCM, the frame size discord.py reads sources at
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+SILENCE = b"\x00" * FRAME_SIZE
+
+
+class MixerSource(discord.AudioSource):
+    """Plays a main source (e.g. music) with any number of effect sources (e.g. meme
+    sound effects) layered over it, without interrupting the main source.
+
+    Frames are mixed with `audioop`, which adds (and scales) whole 16-bit PCM frames
+    in C with saturation instead of clipping or overflowing, the same way discord.py
+    applies volume in `PCMVolumeTransformer`.
+    """
+
+    def __init__(self, source: discord.AudioSource) -> None:
+        if source.is_opus():
+            raise discord.ClientException("MixerSource can only mix PCM sources.")
+
+        self.source = source
+        self.effects: List[Tuple[discord.AudioSource, float]] = []
+        self.frames_read = 0
+        self._source_finished = False
+
+    @property
+    def volume(self) -> float:
+        """Volume of the main source."""
+        return getattr(self.source, "volume", 1.0)
+
+    @volume.setter
+    def volume(self, value: float):
+        # the main source applies its own volume (see `PCMVolumeTransformer`), so
+        # there's no extra pass over the frame for it here
+        self.source.volume = value
+
+    def add_effect(self, source: discord.AudioSource, volume: float = 1.0):
+        """Layers `source` over the main source until it runs out."""
+        if source.is_opus():
+            raise discord.ClientException("MixerSource can only mix PCM sources.")
+        self.effects.append((source, volume))
+
+    def read(self) -> bytes:
+        frame = b""
+        if not self._source_finished:
+            frame = self.source.read()
+            if not frame:
+                self._source_finished = True
+
+        # copy, effects can be added from the event loop thread while we're mixing
+        for effect in list(self.effects):
+            source, volume = effect
+            data = source.read()
+            if not data:
+                self.effects.remove(effect)
+                source.cleanup()
+                continue
+
+            if len(data) < FRAME_SIZE:
+                data += SILENCE[len(data) :]
+            if volume != 1.0:
+                data = audioop.mul(data, 2, volume)
+
+            if frame:
+                if len(frame) < FRAME_SIZE:
+                    frame += SILENCE[len(frame) :]
+                frame = audioop.add(frame, data, 2)
+            else:
+                frame = data
+
+        if frame:
+            self.frames_read += 1
+        return frame
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self.source.cleanup()
+        for source, _ in self.effects:
+            source.cleanup()
+        self.effects = []
+
+
+def is_playing_music(voice_client: discord.VoiceClient | None) -> bool:
+    """Whether the voice client is currently playing (or paused on) a `MixerSource`."""
+    return (
+        voice_client is not None
+        and (voice_client.is_playing() or voice_client.is_paused())
+        and isinstance(voice_client.source, MixerSource)
+    )
+
+
+def is_music_paused(voice_client: discord.VoiceClient | None) -> bool:
+    """Whether the voice client is paused on a `MixerSource`, which effects can't be
+    heard over (see `play_effect`).
+    """
+    return is_playing_music(voice_client) and voice_client.is_paused()
+
+
+def play_effect(
+    voice_client: discord.VoiceClient,
+    source: discord.AudioSource,
+    *,
+    after=None,
+    volume: float = 1.0,
+):
+    """Plays `source` over whatever is currently playing (if it's a `MixerSource`),
+    otherwise just plays it. `after` is only called if the source isn't mixed in.
+
+    Raises `discord.ClientException` if the music is paused, since a mixed in effect
+    wouldn't be heard until the music is resumed.
+    """
+    if is_music_paused(voice_client):
+        raise discord.ClientException("Can't play an effect while music is paused")
+    if is_playing_music(voice_client):
+        voice_client.source.add_effect(source, volume)
+    else:
+        voice_client.play(source, after=after)
@@ -0,0 +1,165 @@
+import asyncio
+import bisect
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class PrefixIndex:
+    """An in-memory index of track titles for autocomplete, matching any word in a
+    title by prefix (case insensitive).
+
+    Every word position of every title is a key in a sorted list, so a lookup is a
+    binary search plus a short scan over the matching keys. Once it holds more than
+    `max_entries` titles, the least recently added ones are dropped.
+    """
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max_entries
+        # url -> title, in the order they were (last) added
+        self._titles: "OrderedDict[str, str]" = OrderedDict()
+        # url -> when it was (last) added, for ordering matches
+        self._added: Dict[str, int] = {}
+        self._counter = 0
+        # sorted (key, url) pairs, where key is the title from a word onwards
+        self._keys: List[Tuple[str, str]] = []
+
+    def __len__(self):
+        return len(self._titles)
+
+    @staticmethod
+    def _suffixes(title: str) -> List[str]:
+        words = title.casefold().split()
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    def add(self, title: str, url: str):
+        """Adds (or refreshes) a title, selecting it should play `url`."""
+        self._counter += 1
+        if self._titles.get(url) == title:
+            self._titles.move_to_end(url)
+            self._added[url] = self._counter
+            return
+        self.remove(url)
+
+        self._titles[url] = title
+        self._added[url] = self._counter
+        for key in self._suffixes(title):
+            bisect.insort(self._keys, (key, url))
+
+        while len(self._titles) > self.max_entries:
+            self.remove(next(iter(self._titles)))
+
+    def remove(self, url: str):
+        title = self._titles.pop(url, None)
+        if title is None:
+            return
+        self._added.pop(url, None)
+        for key in self._suffixes(title):
+            index = bisect.bisect_left(self._keys, (key, url))
+            if index < len(self._keys) and self._keys[index] == (key, url):
+                del self._keys[index]
+
+    def search(self, prefix: str, limit: int = 25) -> List[Tuple[str, str]]:
+        """Returns up to `limit` `(title, url)` pairs with a word starting with
+        `prefix`, most recently added first.
+        """
+        prefix = " ".join(prefix.casefold().split())
+        if not prefix:
+            return [(title, url) for url, title in reversed(self._titles.items())][
+                :limit
+            ]
+
+        urls = set()
+        index = bisect.bisect_left(self._keys, (prefix, ""))
+        while index < len(self._keys) and self._keys[index][0].startswith(prefix):
+            urls.add(self._keys[index][1])
+            index += 1
+
+        matches = sorted(urls, key=self._added.__getitem__, reverse=True)
+        return [(self._titles[url], url) for url in matches[:limit]]
+
+
+class RemoteSearch:
+    """Debounced, cached remote searches (e.g. youtube searches) for autocomplete.
+
+    Autocomplete fires on every keystroke, so a search only goes out once a user
+    stops typing for `debounce` seconds, identical queries share a single in-flight
+    search and results are cached for `ttl` seconds. Searches that outlive
+    `timeout` keep running in the background so their results are cached for the
+    next keystroke, but the caller doesn't wait on them any longer.
+    """
+
+    def __init__(
+        self,
+        search: Callable[[str], Awaitable[List[Tuple[str, str]]]],
+        debounce: float = 0.3,
+        timeout: float = 2.0,
+        ttl: float = 60 * 60,
+        max_cached: int = 1000,
+    ) -> None:
+        self._search = search
+        self.debounce = debounce
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_cached = max_cached
+
+        self._cache: "OrderedDict[str, Tuple[List[Tuple[str, str]], float]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._latest: Dict[int, str] = {}
+
+    def cached(self, query: str) -> List[Tuple[str, str]] | None:
+        key = query.casefold().strip()
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+
+        results, cached_at = cached
+        if time.monotonic() - cached_at > self.ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return results
+
+    async def search(self, user_id: int, query: str) -> List[Tuple[str, str]]:
+        """Searches for `query` on behalf of a user. Returns no results if the user
+        typed something else in the meantime, or if the search timed out.
+        """
+        results = self.cached(query)
+        if results is not None:
+            return results
+
+        self._latest[user_id] = query
+        await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) != query:
+            return []
+        del self._latest[user_id]
+
+        key = query.casefold().strip()
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(key, query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            return []
+
+    async def _fetch(self, key: str, query: str) -> List[Tuple[str, str]]:
+        try:
+            results = await self._search(query)
+        except Exception:
+            logger.exception(f"Remote search for {query!r} failed")
+            return []
+
+        self._cache[key] = (results, time.monotonic())
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return results
@@ -1,33 +1,100 @@
 import asyncio
+from typing import Dict, Set
 
 from discord.ext import commands
 
 from lib.cogs.cog import CommonCog
+from lib.extensions import get_options, hand_over, is_reloading, take_over
+from lib.metrics import ACK_CALLS, ACK_CALLS_SAVED
 
 
 class AcknowledgeCog(CommonCog):
-    """Attaches event listeners that react to commands"""
+    """Attaches event listeners that react to commands.
+
+    `emoji_ack` is only added to commands still running after `ack_delay` seconds,
+    fast commands just get their final reaction. That's one REST call per command
+    instead of three, and less of the channel's reaction rate limit.
+    """
 
     developer_role_id = "385543611191787530"
 
+    def __init__(self, bot: commands.Bot, ack_delay: float = 0.5) -> None:
+        super().__init__(bot)
+        self.ack_delay = ack_delay
+        # message id -> task adding `emoji_ack` once `ack_delay` has passed
+        self._pending_acks: Dict[int, asyncio.Task] = {}
+        # messages whose `emoji_ack` is (being) added, too late to cancel it
+        self._acked: Set[int] = set()
+
+        # reloaded, so keep track of the commands that are still running
+        handed_over = take_over(__name__)
+        if handed_over:
+            self._pending_acks, self._acked = handed_over
+
+    async def cog_unload(self):
+        if is_reloading(__name__):
+            hand_over(__name__, (self._pending_acks, self._acked))
+
+    async def _delayed_acknowledge(self, ctx: commands.Context):
+        await asyncio.sleep(self.ack_delay)
+        self._acked.add(ctx.message.id)
+        # not awaited, so the removal can still cancel it out while it's queued
+        self.dispatcher.add_reaction(ctx.message, self.emoji_ack)
+
+    async def _settle(self, ctx: commands.Context, emoji: str):
+        """Adds the final reaction, and removes `emoji_ack` if it was added."""
+        task = self._pending_acks.pop(ctx.message.id, None)
+        acked = ctx.message.id in self._acked
+        self._acked.discard(ctx.message.id)
+
+        if not acked:
+            # finished before the ack went out, so it (and its removal) never happen
+            if task is not None:
+                task.cancel()
+                ACK_CALLS_SAVED.inc(2)
+            await self.dispatcher.add_reaction(ctx.message, emoji)
+            ACK_CALLS.inc()
+            return
+
+        # the ack and its removal share a dispatcher bucket, so the removal can't
+        # overtake it, and if the ack is still queued, neither is sent
+        removal = self.dispatcher.remove_reaction(
+            ctx.message, self.emoji_ack, self.bot.user
+        )
+        if removal.done():
+            ACK_CALLS_SAVED.inc(2)
+        else:
+            ACK_CALLS.inc(2)
+        await asyncio.gather(self.dispatcher.add_reaction(ctx.message, emoji), removal)
+        ACK_CALLS.inc()
+
     # -vvv- event listeners -vvv-
     @commands.Cog.listener()
     async def on_command(self, ctx: commands.Context):
-        await self.acknowledge(ctx)
+        self._pending_acks[ctx.message.id] = asyncio.create_task(
+            self._delayed_acknowledge(ctx)
+        )
 
     @commands.Cog.listener()
     async def on_command_completion(self, ctx: commands.Context):
-        await self.finish(ctx)
+        await self._settle(ctx, self.emoji_finish)
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx: commands.Context, error):
         if isinstance(error, commands.errors.CommandNotFound):
-            await self.react_reject(ctx)
+            # never acknowledged, nothing to remove
+            await self.dispatcher.add_reaction(ctx.message, self.emoji_reject)
+            ACK_CALLS.inc()
         else:
             await asyncio.gather(
-                self.react_error(ctx),
-                ctx.send(
-                    "Something went wrong! Sorry :(\n" f"<@&{self.developer_role_id}>"
+                self._settle(ctx, self.emoji_error),
+                self.dispatcher.send(
+                    ctx.channel,
+                    "Something went wrong! Sorry :(\n" f"<@&{self.developer_role_id}>",
                 ),
             )
             raise error
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(AcknowledgeCog(bot, **get_options(__name__)))
@@ -0,0 +1,61 @@
+from time import perf_counter
+
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from lib.extensions import get_options, reload_extensions
+from lib.logging import get_logger
+from lib.tree_sync import tree_hash
+
+
+class AdminCog(commands.Cog):
+    """Owner-only commands for running the bot."""
+
+    def __init__(self, bot: commands.Bot) -> None:
+        super().__init__()
+        self.bot = bot
+        self.logger = get_logger(__name__)
+
+    @commands.command()
+    @commands.is_owner()
+    async def reload(self, ctx: Context, *names: str):
+        """Reloads cogs (e.g. `!reload music qod`, or all of them by default)
+        from their updated code, without restarting the bot or losing their state.
+
+        Only the cog modules in `lib/cogs/` are reloaded, changes to anything else
+        (and to the gateway intents) still need a restart.
+        """
+        # imported here, since amarbot imports the cogs
+        from amarbot import COGS
+
+        # cogs go by the same names as their `--no_*` flags, e.g. `qod`
+        unknown = [name for name in names if name not in COGS]
+        if unknown:
+            await ctx.send(
+                f"Unknown cogs: {', '.join(unknown)} (choose from {', '.join(COGS)})"
+            )
+            return
+        extensions = [COGS[name][0] for name in names] or list(self.bot.extensions)
+        disabled = [
+            name for name in names if COGS[name][0] not in self.bot.extensions
+        ]
+        if disabled:
+            await ctx.send(f"Not loaded: {', '.join(disabled)}")
+            return
+
+        before = tree_hash(self.bot.tree)
+        start = perf_counter()
+        reloaded, failed = await reload_extensions(self.bot, extensions)
+        duration = perf_counter() - start
+        self.logger.info(f"Reloaded {reloaded} in {duration * 1000:.0f}ms")
+
+        lines = [f"Reloaded {len(reloaded)} cogs in {duration * 1000:.0f}ms."]
+        for name, error in failed.items():
+            lines.append(f"Failed to reload `{name}`: {error.__cause__ or error}")
+        if tree_hash(self.bot.tree) != before:
+            lines.append("Slash commands changed, use `!sync` to push them.")
+        await ctx.send("\n".join(lines))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(AdminCog(bot, **get_options(__name__)))
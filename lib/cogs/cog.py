@@ -3,6 +3,9 @@ import asyncio
 import discord
 from discord.ext import commands
 
+from lib.audio import is_playing_music
+from lib.dispatch import get_dispatcher
+
 
 class CommonCog(commands.Cog):
     emoji_ack = "⏳"
@@ -13,11 +16,12 @@ class CommonCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         super().__init__()
         self.bot = bot
+        self.dispatcher = get_dispatcher()
 
     # -vvv- emoji reactions -vvv-
     async def acknowledge(self, ctx: commands.Context):
         """Adds `emoji_ack` to users issued command."""
-        await ctx.message.add_reaction(self.emoji_ack)
+        await self.dispatcher.add_reaction(ctx.message, self.emoji_ack)
         # TODO: check if user has sufficient privileges
         # for role in ctx.message.author.roles:
         #     if role.permissions.manage_permissions is not True:
@@ -27,22 +31,28 @@ class CommonCog(commands.Cog):
     async def finish(self, ctx: commands.Context):
         """Removes `emoji_ack` and adds `emoji_finish` to users issued command."""
         await asyncio.gather(
-            ctx.message.add_reaction(self.emoji_finish),
-            ctx.message.remove_reaction(self.emoji_ack, self.bot.user),
+            self.dispatcher.add_reaction(ctx.message, self.emoji_finish),
+            self.dispatcher.remove_reaction(
+                ctx.message, self.emoji_ack, self.bot.user
+            ),
         )
 
     async def react_reject(self, ctx: commands.Context):
         """Removes `emoji_ack` and adds `emoji_error` to users issued command."""
         await asyncio.gather(
-            ctx.message.add_reaction(self.emoji_reject),
-            ctx.message.remove_reaction(self.emoji_ack, self.bot.user),
+            self.dispatcher.add_reaction(ctx.message, self.emoji_reject),
+            self.dispatcher.remove_reaction(
+                ctx.message, self.emoji_ack, self.bot.user
+            ),
         )
 
     async def react_error(self, ctx: commands.Context):
         """Removes `emoji_ack` and adds `emoji_error` to users issued command."""
         await asyncio.gather(
-            ctx.message.add_reaction(self.emoji_error),
-            ctx.message.remove_reaction(self.emoji_ack, self.bot.user),
+            self.dispatcher.add_reaction(ctx.message, self.emoji_error),
+            self.dispatcher.remove_reaction(
+                ctx.message, self.emoji_ack, self.bot.user
+            ),
         )
 
     # -vvv- voice channel related commands -vvv-
@@ -54,7 +64,7 @@ class CommonCog(commands.Cog):
             else:
                 await ctx.send("You are not connected to a voice channel.")
                 raise commands.CommandError("Author not connected to a voice channel.")
-        elif ctx.voice_client.is_playing():
+        elif ctx.voice_client.is_playing() and not is_playing_music(ctx.voice_client):
             ctx.voice_client.stop()
 
     async def join_vc(self, ctx: commands.Context, *, channel: discord.VoiceChannel):
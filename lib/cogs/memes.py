@@ -4,7 +4,9 @@ import random
 from discord import Interaction, app_commands
 from discord.ext import commands
 
-from lib.common import join_users_vc
+from lib.audio import is_music_paused, play_effect
+from lib.common import connectable_channels, join_users_vc, leave_vc, move_members
+from lib.extensions import get_options
 from lib.logging import get_logger
 from lib.permissions import GuildPermissions
 from lib.ytdl import YTDLSource
@@ -13,6 +15,10 @@ from lib.ytdl import YTDLSource
 class MemeCog(commands.GroupCog, group_name="memes"):
     """Commands suggested by my friends/community just for fun."""
 
+    gateway_intents = ("voice_states",)
+    # who's in a voice channel, to pick who to kick or move
+    member_cache_flags = ("voice",)
+
     def __init__(self, bot: commands.Bot) -> None:
         super().__init__()
         self.bot = bot
@@ -23,12 +29,27 @@ class MemeCog(commands.GroupCog, group_name="memes"):
         if error:
             self.logger.error(f"Player error:\n{error}")
 
+    async def music_paused(self, interaction: Interaction) -> bool:
+        """Lets the user know (and returns `True`) if music is paused, which sounds
+        can't be played over until it's resumed.
+        """
+        if not is_music_paused(interaction.guild.voice_client):
+            return False
+        await interaction.response.send_message(
+            "The music is paused, `resume` it first so this can be heard!",
+            ephemeral=True,
+        )
+        return True
+
     # -vvv- commands suggested by me (very, very annoying) -vvv-
     @app_commands.command()
     @app_commands.check(GuildPermissions.can_kick)
     async def roulette(self, interaction: Interaction):
         """Plays a gunshot sounds and kicks a random user from the voice channel."""
 
+        if await self.music_paused(interaction):
+            return
+
         voice_client = await join_users_vc(self.bot, interaction)
 
         if not voice_client:
@@ -37,8 +58,8 @@ class MemeCog(commands.GroupCog, group_name="memes"):
 
         await interaction.response.send_message("Someone's fate has been sealed!")
 
-        gun_sound = YTDLSource.from_file("sounds/roulette.wav")
-        voice_client.play(gun_sound)
+        gun_sound = await YTDLSource.from_file("sounds/roulette.wav")
+        play_effect(voice_client, gun_sound)
 
         # sleep so user can hear gunshot before they go
         await asyncio.sleep(gun_sound.data["duration"])
@@ -47,13 +68,16 @@ class MemeCog(commands.GroupCog, group_name="memes"):
         chosen_one = random.choice(targets)
         await chosen_one.edit(voice_channel=None)
 
-        await voice_client.disconnect()
+        await leave_vc(voice_client)
 
     @app_commands.command()
     @app_commands.check(GuildPermissions.can_kick)
     async def driveby(self, interaction: Interaction):
         """Plays machine gun sound while kicking multiple people from the voice channel."""
 
+        if await self.music_paused(interaction):
+            return
+
         voice_client = await join_users_vc(self.bot, interaction)
 
         if not voice_client:
@@ -64,31 +88,31 @@ class MemeCog(commands.GroupCog, group_name="memes"):
             "**Yo this black car just pulled up...**"
         )
 
-        gun_sound = YTDLSource.from_file("sounds/machine_gun.wav")
-        voice_client.play(gun_sound)
-
-        # initial wait so everyone can here the "CHK CHK"
-        await asyncio.sleep(1)
+        gun_sound = await YTDLSource.from_file("sounds/machine_gun.wav")
+        play_effect(voice_client, gun_sound)
 
         targets = [member for member in voice_client.channel.members if not member.bot]
+        random.shuffle(targets)
 
-        # keep going until everyone has been kicked
-        # TODO: refactor this. while loop will block until the entire 5 seconds is done
-        while targets:
-            await asyncio.sleep(random.uniform(0.5, 1.5))
-            user = random.choice(targets)
-            await user.edit(voice_channel=None)
-            targets.remove(user)
-            if len(targets) == 0:
-                break
+        # initial wait so everyone can here the "CHK CHK", then everyone gets hit
+        # 0.5-1.5 seconds apart
+        moves = []
+        delay = 1
+        for target in targets:
+            delay += random.uniform(0.5, 1.5)
+            moves.append((target, None, delay))
+        await move_members(moves)
 
-        await voice_client.disconnect()
+        await leave_vc(voice_client)
 
     @app_commands.command()
     @app_commands.check(GuildPermissions.can_kick)
     async def grenade(self, interaction: Interaction):
         """Plays grenade sound while everyone is scattered across various channels."""
 
+        if await self.music_paused(interaction):
+            return
+
         voice_client = await join_users_vc(self.bot, interaction)
 
         if not voice_client:
@@ -97,33 +121,34 @@ class MemeCog(commands.GroupCog, group_name="memes"):
 
         await interaction.response.send_message("**GRENAAAADDEEE!!**")
 
-        grenade_sound = YTDLSource.from_file("sounds/grenade_oh_fudge.wav")
-        voice_client.play(grenade_sound)
-
-        # sleep so users can hear grenade and "OH FUDGE"
-        await asyncio.sleep(3)
+        grenade_sound = await YTDLSource.from_file("sounds/grenade_oh_fudge.wav")
+        play_effect(voice_client, grenade_sound)
 
-        all_voice_channels = interaction.guild.voice_channels
+        targets = [member for member in voice_client.channel.members if not member.bot]
 
         # avoid kicking them into a channel they dont have access to
-        for member in voice_client.channel.members:
-            if member.bot:
-                continue
-
-            available_channels = []
-            for channel in all_voice_channels:
-                if channel.permissions_for(member).connect:
-                    available_channels.append(channel)
+        available_channels = connectable_channels(
+            targets, interaction.guild.voice_channels
+        )
 
-            await member.edit(voice_channel=random.choice(available_channels))
+        # everyone gets scattered at once, after they hear the grenade and "OH FUDGE"
+        moves = [
+            (member, random.choice(available_channels[member.id]), 3)
+            for member in targets
+            if available_channels[member.id]
+        ]
+        await move_members(moves)
 
-        await voice_client.disconnect()
+        await leave_vc(voice_client)
 
     # -vvv- commands suggested by Tunu -vvv-
     @app_commands.command()
     async def minecraft(self, interaction: Interaction):
         """Plays the "Mining - Minecraft Parody of Drowning" music video."""
 
+        if await self.music_paused(interaction):
+            return
+
         voice_client = await join_users_vc(self.bot, interaction)
 
         if not voice_client:
@@ -137,13 +162,20 @@ class MemeCog(commands.GroupCog, group_name="memes"):
         minecraft_meme_music = await YTDLSource.from_url(
             url, loop=self.bot.loop, stream=True
         )
-        voice_client.play(minecraft_meme_music, after=lambda e: self._on_song_finish(e))
+        play_effect(
+            voice_client,
+            minecraft_meme_music,
+            after=lambda e: self._on_song_finish(e),
+        )
 
     # -vvv- commands suggested by Sandi -vvv-
     @app_commands.command()
     async def smd(self, interaction: Interaction):
         """Plays the grapefruit technique video. I'm sorry."""
 
+        if await self.music_paused(interaction):
+            return
+
         voice_client = await join_users_vc(self.bot, interaction)
 
         if not voice_client:
@@ -159,7 +191,9 @@ class MemeCog(commands.GroupCog, group_name="memes"):
         grapefruit_video = await YTDLSource.from_url(
             url, loop=self.bot.loop, stream=True
         )
-        voice_client.play(grapefruit_video, after=lambda e: self._on_song_finish(e))
+        play_effect(
+            voice_client, grapefruit_video, after=lambda e: self._on_song_finish(e)
+        )
 
     # -vvv- commands suggested by Aladin -vvv-
     @app_commands.command()
@@ -233,3 +267,7 @@ class MemeCog(commands.GroupCog, group_name="memes"):
         await interaction.response.send_message(
             f'> "{random.choice(goggins_quotes)}" - **David Goggins**'
         )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(MemeCog(bot, **get_options(__name__)))
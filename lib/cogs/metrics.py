@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from lib.cogs.cog import CommonCog
+from lib.extensions import get_options
+from lib.logging import get_logger
+from lib.metrics import (
+    COMMAND_LATENCY,
+    RATE_LIMITS,
+    RateLimitCounter,
+    measure_loop_lag,
+    registry,
+)
+
+
+class MetricsCog(CommonCog):
+    """Collects metrics about the bot (command latency, event loop lag, rate limits)
+    and serves them in the Prometheus text format on a local `/metrics` endpoint.
+    """
+
+    def __init__(
+        self, bot: commands.Bot, host: str = "127.0.0.1", port: int = 9464
+    ) -> None:
+        super().__init__(bot)
+        self.logger = get_logger(__name__)
+        self.logger.debug("Initializing MetricsCog...")
+
+        self.host = host
+        self.port = port
+        self.rate_limit_counter = RateLimitCounter(RATE_LIMITS)
+        self._loop_lag_task: asyncio.Task | None = None
+
+    async def cog_load(self):
+        await registry.start_server(self.host, self.port)
+        self._loop_lag_task = asyncio.get_running_loop().create_task(
+            measure_loop_lag()
+        )
+        logging.getLogger("discord.http").addFilter(self.rate_limit_counter)
+
+    async def cog_unload(self):
+        logging.getLogger("discord.http").removeFilter(self.rate_limit_counter)
+        if self._loop_lag_task:
+            self._loop_lag_task.cancel()
+        await registry.stop_server()
+
+    # -vvv- event listeners -vvv-
+    @commands.Cog.listener()
+    async def on_command(self, ctx: commands.Context):
+        ctx.metrics_started_at = time.perf_counter()
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context):
+        self._observe_command(ctx, "ok")
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx: commands.Context, error):
+        self._observe_command(ctx, "error")
+
+    def _observe_command(self, ctx: commands.Context, status: str):
+        started_at = getattr(ctx, "metrics_started_at", None)
+        if started_at is None or ctx.command is None:
+            return
+        COMMAND_LATENCY.labels(ctx.command.qualified_name, "prefix", status).observe(
+            time.perf_counter() - started_at
+        )
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(
+        self, interaction: discord.Interaction, command: app_commands.Command
+    ):
+        # measured from when the interaction was created, so this includes the time
+        # it took to reach us
+        duration = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        COMMAND_LATENCY.labels(command.qualified_name, "slash", "ok").observe(duration)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(MetricsCog(bot, **get_options(__name__)))
@@ -1,40 +1,187 @@
 import asyncio
-from typing import List
+import time
+from typing import Callable, Dict, List, Tuple
 
+import discord
+from discord import app_commands
 from discord.ext import commands
 
+from lib.audio import MixerSource
+from lib.autocomplete import PrefixIndex, RemoteSearch
 from lib.cogs.cog import CommonCog
+from lib.common import join_users_vc
+from lib.dispatch import Priority, get_dispatcher
+from lib.extensions import get_options, hand_over, is_reloading, take_over
 from lib.logging import get_logger
+from lib.metrics import MUSIC_EXTRACTION, MUSIC_QUEUE_DEPTH
+from lib.queue_store import QueueStore
+from lib.startup import preload
+from lib.tracks import LoudnessAnalyzer, TrackCache
 from lib.ytdl import YTDLSource
 
 
 class MusicCog(CommonCog):
     """Commands related to playing music."""
 
+    gateway_intents = ("voice_states",)
+
+    # below this many local autocomplete suggestions, youtube gets searched as well
+    remote_search_below = 5
+
+    # state handed over to the next version of the cog when it's reloaded
+    handover_attributes = (
+        "tracks",
+        "loudness",
+        "queue_store",
+        "controllers",
+        "title_index",
+        "remote_search",
+    )
+
     def __init__(self, bot: commands.Bot) -> None:
         super().__init__(bot)
         self.logger = get_logger(__name__)
         self.logger.debug("Initializing MusicCog...")
-        self.controller = MusicController(bot.loop)
+
+        handed_over = take_over(__name__)
+        if handed_over:
+            # reloaded, carry on playing (the controllers keep running the code they
+            # were created with, new ones run the new code)
+            for name, value in handed_over.items():
+                setattr(self, name, value)
+            for controller in self.controllers.values():
+                controller.on_track_start = self._remember_track
+        else:
+            self._init_state()
+
+        MUSIC_QUEUE_DEPTH.set_function(
+            lambda: {
+                (str(guild_id),): len(controller.queue)
+                for guild_id, controller in self.controllers.items()
+            }
+        )
+
+    def _init_state(self):
+        self.tracks = TrackCache()
+        self.loudness = LoudnessAnalyzer(self.tracks)
+        self.queue_store = QueueStore()
+        self.controllers: Dict[int, MusicController] = {}
+
+        # autocomplete suggestions, from previously played tracks (most recent last)
+        # and youtube searches
+        self.title_index = PrefixIndex()
+        played = [track for track in self.tracks.tracks.values() if "title" in track]
+        for track in sorted(played, key=lambda track: track.get("played_at", 0)):
+            self.title_index.add(track["title"], track["url"])
+        self.remote_search = RemoteSearch(
+            lambda query: YTDLSource.search(query, loop=self.bot.loop)
+        )
+
+    def get_controller(self, guild: discord.Guild) -> "MusicController":
+        """Returns the music controller of a guild, creating it if needed."""
+        controller = self.controllers.get(guild.id)
+        if controller is None:
+            controller = MusicController(
+                self.bot.loop,
+                guild,
+                store=self.queue_store,
+                loudness=self.loudness,
+                on_track_start=self._remember_track,
+            )
+            self.controllers[guild.id] = controller
+        return controller
+
+    def _remember_track(self, data: dict):
+        if not data.get("id") or not data.get("webpage_url"):
+            return
+        self.tracks.update(
+            data["id"],
+            title=data["title"],
+            url=data["webpage_url"],
+            played_at=int(time.time()),
+        )
+        self.title_index.add(data["title"], data["webpage_url"])
+
+    async def cog_load(self):
+        # youtube_dl is slow to import, get it out of the way in the background
+        # (while the bot connects) rather than on the first `play`
+        self._preload_task = self.bot.loop.create_task(preload("youtube_dl"))
+
+    async def cog_unload(self):
+        MUSIC_QUEUE_DEPTH.set_function(None)
+        if is_reloading(__name__):
+            state = {name: getattr(self, name) for name in self.handover_attributes}
+            hand_over(__name__, state)
+            return
+
+        # save where every guild is at, so playback picks back up after a restart
+        for controller in self.controllers.values():
+            controller.shutdown()
+        self.queue_store.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild_id in self.queue_store.guild_ids():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild_id in self.controllers:
+                continue
+            try:
+                await self.get_controller(guild).restore()
+            except Exception:
+                self.logger.exception(f"Failed to restore the music queue of {guild_id}")
 
     @commands.command()
     async def play(self, ctx: commands.Context, *, url):
         """Plays from a query or url (almost anything youtube_dl supports)"""
         async with ctx.typing():
-            self.controller.update_ctx(ctx)
-
-            if self.controller.is_stopped:
-                self.controller.push(url)
-                self.controller.play()
-            else:
-                # TODO: adjust MusicController to handle this more cleanly / better
-                # skip the song first, so that the first song in the queue (the song
-                # that's current playing) gets removed from the queue, THEN insert our
-                # next song before the async player picks up the next song in the queue
-                self.controller.skip()
-                self.controller.insert(url)
-
-            await self.controller.on_player_start()
+            controller = self.get_controller(ctx.guild)
+            controller.update_channels(ctx.channel, ctx.voice_client.channel)
+            controller.play_now(url)
+            await controller.on_player_start()
+
+    @app_commands.command(name="play")
+    @app_commands.describe(query="A url or something to search youtube for")
+    async def play_slash(self, interaction: discord.Interaction, query: str):
+        """Plays from a query or url (almost anything youtube_dl supports)"""
+        await interaction.response.defer(thinking=True)
+
+        voice_client = await join_users_vc(self.bot, interaction)
+        if not voice_client:
+            return
+
+        controller = self.get_controller(interaction.guild)
+        controller.update_channels(interaction.channel, voice_client.channel)
+        controller.play_now(query)
+        await interaction.followup.send(f"Playing: {query}")
+
+    @play_slash.autocomplete("query")
+    async def play_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        suggestions = self.title_index.search(current)
+
+        query = current.strip()
+        if (
+            len(suggestions) < self.remote_search_below
+            and len(query) >= 3
+            and not query.startswith(("http://", "https://"))
+        ):
+            urls = {url for _, url in suggestions}
+            for title, url in await self.remote_search.search(
+                interaction.user.id, query
+            ):
+                self.title_index.add(title, url)
+                if url not in urls:
+                    suggestions.append((title, url))
+
+        # picking a suggestion plays its url, so there's nothing left to search for.
+        # Discord rejects the whole response if a value is over 100 characters, and a
+        # shortened url wouldn't play, so those suggestions are left out
+        suggestions = [(title, url) for title, url in suggestions if len(url) <= 100]
+        return [
+            app_commands.Choice(name=title[:100], value=url)
+            for title, url in suggestions[:25]
+        ]
 
     @commands.command()
     async def volume(self, ctx: commands.Context, volume: int):
@@ -55,7 +202,7 @@ class MusicCog(CommonCog):
         if ctx.voice_client is None:
             return await ctx.send("Not connected to a voice channel.")
 
-        self.controller.pause()
+        self.get_controller(ctx.guild).pause()
 
     @commands.command()
     async def resume(self, ctx: commands.Context):
@@ -63,25 +210,26 @@ class MusicCog(CommonCog):
         if ctx.voice_client is None:
             return await ctx.send("Not connected to a voice channel.")
 
-        self.controller.resume()
+        self.get_controller(ctx.guild).resume()
 
     @commands.command()
     async def queue(self, ctx: commands.Context, *, url: str | None = None):
         """Add a song to the queue. If no url is provided, shows the current queue."""
+        controller = self.get_controller(ctx.guild)
         if url:
             async with ctx.typing():
-                self.controller.push(url)
+                controller.push(url)
                 await ctx.send(
-                    f"Added to queue: {url} ({len(self.controller.queue)} in queue)"
+                    f"Added to queue: {url} ({len(controller.queue)} in queue)"
                 )
         else:
             async with ctx.typing():
-                if len(self.controller.queue) == 0:
+                if len(controller.queue) == 0:
                     await ctx.send("No songs in the queue")
                     return
 
                 list_str = "Songs in the current queue:\n"
-                for index, song_name in enumerate(self.controller.queue):
+                for index, song_name in enumerate(controller.queue):
                     list_str += f"> {index + 1}. {song_name}"
                     if index == 0:
                         list_str += " *(currently playing)*\n"
@@ -91,22 +239,23 @@ class MusicCog(CommonCog):
                 await ctx.send(list_str.strip())
 
     @commands.command()
-    async def pop(self, ctx: commands.Context, *, index: int):
+    async def pop(self, ctx: commands.Context, *, index: int | None = None):
         """Remove a song from the queue at index (default last)"""
+        controller = self.get_controller(ctx.guild)
         async with ctx.typing():
-            if len(self.controller.queue) < 2:
+            if len(controller.queue) < 2:
                 await ctx.send("No songs in the queue to remove")
                 return
 
-            song_name = self.controller.pop(index and index - 1 or None)
+            song_name = controller.pop(index - 1 if index else None)
             await ctx.send(
-                f"Removed from queue: {song_name} ({len(self.controller.queue)} in queue)"
+                f"Removed from queue: {song_name} ({len(controller.queue)} in queue)"
             )
 
     @commands.command()
     async def skip(self, ctx: commands.Context):
         """Skip the current playing song"""
-        self.controller.skip()
+        self.get_controller(ctx.guild).skip()
 
     @commands.command()
     async def stop(self, ctx: commands.Context):
@@ -119,13 +268,36 @@ class MusicCog(CommonCog):
 
 
 class MusicController:
-    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+    """Plays a guild's music queue. Every change to the queue (and, periodically, the
+    playback position) is persisted to the `QueueStore`, so it can be restored after
+    a restart.
+    """
+
+    # how long prefetched track data can be used for, youtube invalidates the stream
+    # urls after a while
+    prefetch_ttl = 30 * 60
+    # how often the playback position gets persisted while playing, in seconds
+    position_interval = 10
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        guild: discord.Guild,
+        store: QueueStore | None = None,
+        loudness: LoudnessAnalyzer | None = None,
+        on_track_start: Callable[[dict], None] | None = None,
+    ) -> None:
         self.logger = get_logger(__name__)
-        self.logger.debug("Initializing MusicController...")
+        self.logger.debug(f"Initializing MusicController for {guild.id}...")
 
         self.loop = loop
+        self.guild = guild
+        self.store = store
+        self.loudness = loudness
+        self.on_track_start = on_track_start
+        self.dispatcher = get_dispatcher()
         self.queue: List[str] = []
-        self.ctx: commands.Context | None = None
+        self.text_channel: discord.abc.Messageable | None = None
         self.player: YTDLSource | None = None
         self.is_stopped = False
 
@@ -133,11 +305,50 @@ class MusicController:
         self._song_started_event: asyncio.Event = asyncio.Event()
         self._song_finished_event: asyncio.Event = asyncio.Event()
 
+        # (url, track data, time prefetched) of the next song in the queue
+        self._prefetched: Tuple[str, dict, float] | None = None
+        self._prefetch_task: asyncio.Task | None = None
+
+        # offset to start the next song at (set when restoring), and the offset the
+        # current song was started at
+        self._resume_at = 0.0
+        self._started_at = 0.0
+        self._position_saved_at = 0.0
+        self._saved_position = 0.0
+        self._shutting_down = False
+
         # kick off event loop
         self._update_task = self.loop.create_task(self.update_loop())
 
-    def update_ctx(self, ctx: commands.Context):
-        self.ctx = ctx
+    @property
+    def voice_client(self) -> discord.VoiceClient | None:
+        return self.guild.voice_client
+
+    @property
+    def position(self) -> float:
+        """How far into the current song playback is, in seconds."""
+        source = self.voice_client and self.voice_client.source
+        if not isinstance(source, MixerSource):
+            return 0.0
+        # discord.py reads sources in 20ms frames
+        return self._started_at + source.frames_read * 0.02
+
+    def update_channels(
+        self,
+        text_channel: discord.abc.Messageable,
+        voice_channel: discord.abc.Connectable,
+    ):
+        """Sets where "now playing" messages go and which voice channel to rejoin
+        after a restart.
+        """
+        self.text_channel = text_channel
+        self._log(
+            {
+                "op": "channels",
+                "voice_channel_id": voice_channel.id,
+                "text_channel_id": text_channel.id,
+            }
+        )
 
     async def update_loop(self):
         # run update loop every 1 second
@@ -148,31 +359,154 @@ class MusicController:
             if len(self.queue) > 0:
                 self._song_task = self.loop.create_task(self._play())
 
+        if self.loop.time() - self._position_saved_at >= self.position_interval:
+            self.save_position()
+
         # schedule next update
         self._update_task = self.loop.create_task(self.update_loop())
 
     async def _play(self):
         next_song = self.queue[0]
 
-        self.player = await YTDLSource.from_url(next_song, loop=self.loop, stream=True)
+        data = self._take_prefetched(next_song)
+        if data is None:
+            with MUSIC_EXTRACTION.labels(str(self.guild.id)).time():
+                data = await YTDLSource.extract(next_song, loop=self.loop, stream=True)
+
+        gain_db = None
+        if self.loudness and data.get("id"):
+            gain_db = self.loudness.gain(data["id"])
+            if gain_db is None:
+                # too late for this time, but it'll be normalized next time
+                self.loudness.analyze(data["id"], data["url"])
+
+        self._started_at, self._resume_at = self._resume_at, 0.0
+        self.player = await YTDLSource.from_data(
+            data, stream=True, gain_db=gain_db, start=self._started_at
+        )
         self.queue[0] = f"{self.player.title}"
-        self.ctx.voice_client.play(self.player, after=lambda e: self._on_song_finish(e))
+        # persist the resolved url rather than the query, so a restore plays the
+        # exact same track
+        self._log({"op": "set", "index": 0, "url": data.get("webpage_url") or next_song})
+        # play through a mixer, so sound effects can be layered over the music
+        self.voice_client.play(
+            MixerSource(self.player), after=lambda e: self._on_song_finish(e)
+        )
 
         self._song_started_event.set()
-        await self.ctx.send(f"Now playing: {self.player.title}")
+        if self.on_track_start:
+            self.on_track_start(data)
+        self._prefetch_next()
+        if self.text_channel:
+            # not awaited, and replaced by the next song's if it hasn't gone out yet
+            self.dispatcher.post(
+                self.text_channel,
+                f"Now playing: {self.player.title}",
+                priority=Priority.INTERACTIVE,
+                key=("now_playing", self.guild.id),
+            )
 
         await self._song_finished_event.wait()
 
+    def _prefetch_next(self):
+        """Extracts (and analyzes the loudness of) the next song in the queue in the
+        background, while the current one is playing.
+        """
+        if len(self.queue) < 2 or not self._song_started_event.is_set():
+            return
+
+        if self._prefetch_task and not self._prefetch_task.done():
+            self._prefetch_task.cancel()
+        self._prefetch_task = self.loop.create_task(self._prefetch(self.queue[1]))
+
+    async def _prefetch(self, url: str):
+        try:
+            with MUSIC_EXTRACTION.labels(str(self.guild.id)).time():
+                data = await YTDLSource.extract(url, loop=self.loop, stream=True)
+        except Exception:
+            self.logger.exception(f"Failed to prefetch {url}")
+            return
+
+        self._prefetched = (url, data, self.loop.time())
+
+        if self.loudness and data.get("id"):
+            # shielded, a superseded prefetch shouldn't throw away the analysis
+            await asyncio.shield(self.loudness.analyze(data["id"], data["url"]))
+
+    def _take_prefetched(self, url: str) -> dict | None:
+        if self._prefetched is None:
+            return None
+
+        prefetched_url, data, prefetched_at = self._prefetched
+        self._prefetched = None
+        if prefetched_url != url or self.loop.time() - prefetched_at > self.prefetch_ttl:
+            return None
+        return data
+
     def _on_song_finish(self, error):
         # NOTE: doesnt run if the stop command is issued
+        # runs in discord.py's audio player thread, hand off to the event loop
+        self.loop.call_soon_threadsafe(self._finish_song, error)
+
+    def _finish_song(self, error):
         if error:
             self.logger.error(f"Player error:\n{error}")
 
-        self.queue.pop(0)
-        self.loop.call_soon_threadsafe(self._song_finished_event.set)
-        self.loop.call_soon_threadsafe(self._song_started_event.clear)
+        if self.queue:
+            self.queue.pop(0)
+            self._log({"op": "pop", "index": 0})
+        self._song_finished_event.set()
+        self._song_started_event.clear()
         self._song_task = None
 
+    # -vvv- persistence -vvv-
+    def _log(self, entry: dict):
+        # once shutting down, the queue is left as it was persisted (disconnecting
+        # from voice finishes the current song, which shouldn't drop it from the queue)
+        if self.store and not self._shutting_down:
+            self.store.append(self.guild.id, entry)
+
+    def save_position(self):
+        """Persists how far into the current song playback is."""
+        self._position_saved_at = self.loop.time()
+        position = round(self.position, 2)
+        if position and position != self._saved_position:
+            self._saved_position = position
+            self._log({"op": "position", "position": position})
+
+    async def restore(self):
+        """Restores the persisted queue, reconnecting to voice and picking the current
+        song back up where it left off.
+        """
+        state = self.store.load(self.guild.id)
+        if not state.queue:
+            return
+
+        self.queue = list(state.queue)
+        self._resume_at = state.position
+        self.text_channel = self.guild.get_channel(state.text_channel_id or 0)
+
+        voice_channel = self.guild.get_channel(state.voice_channel_id or 0)
+        if voice_channel is None:
+            # nowhere to play, keep the queue for the next `play`
+            self.is_stopped = True
+            return
+        if self.voice_client is None:
+            await voice_channel.connect()
+
+        self.logger.info(
+            f"Restored {len(self.queue)} songs for {self.guild.id}, resuming at "
+            f"{self._resume_at:.0f}s"
+        )
+
+    def shutdown(self):
+        """Saves the playback position and stops persisting any further changes."""
+        self.save_position()
+        self._shutting_down = True
+        self.is_stopped = True
+        self._update_task.cancel()
+
+    # -vvv- controls -vvv-
     def play(self):
         """Plays a song from the top of the queue.
 
@@ -181,32 +515,44 @@ class MusicController:
         """
         self.is_stopped = False
 
+    def play_now(self, url: str):
+        """Plays a url right away, skipping the current song if one is playing."""
+        if self.is_stopped:
+            self.push(url)
+            self.play()
+        else:
+            # insert our song right after the one that's currently playing, THEN
+            # skip, so the current song (the first in the queue) gets removed from
+            # the queue and the async player picks up ours next
+            self.insert(url, 1)
+            self.skip()
+
     def stop(self):
         """Stops the current song and removes it from the queue. Does not schedule
         the next song.
         """
-        self.ctx.voice_client.stop()
-        self._song_task.cancel()
-        self.queue.pop(0)
         self.is_stopped = True
-        self._song_task = None
+        self.voice_client.stop()
+        self._song_task.cancel()
 
     def pause(self):
         """Pauses the current playing song."""
-        self.ctx.voice_client.pause()
+        self.voice_client.pause()
+        self.save_position()
 
     def resume(self):
         """Resumes the current playing song."""
-        self.ctx.voice_client.resume()
+        self.voice_client.resume()
 
-    def insert(self, url: str):
-        """Insert a url into the first position of the queue, effectively making it the
-        next song to be played.
+    def insert(self, url: str, index: int = 0):
+        """Insert a url into the queue at `index` (the first position by default).
+        While a song is playing, index 1 makes it the next song to be played.
         """
-        try:
-            self.queue.insert(0, url)
-        except IndexError:
-            self.push(url)
+        index = min(index, len(self.queue))
+        self.queue.insert(index, url)
+        self._log({"op": "insert", "index": index, "url": url})
+        if index <= 1:
+            self._prefetch_next()
 
     def push(self, url: str):
         """Insert a url into the queue"""
@@ -214,15 +560,23 @@ class MusicController:
         # the title so we can regrab it later, since youtube invalidates the links
         # after some time
         self.queue.append(url)
-
-    def pop(self, index: int):
-        """Remove a song from the queue and return the name."""
-        return self.queue.pop(index)
+        self._log({"op": "push", "url": url})
+        if len(self.queue) == 2:
+            self._prefetch_next()
+
+    def pop(self, index: int | None = None):
+        """Remove a song from the queue (the last one by default) and return the name."""
+        if index is None:
+            index = len(self.queue) - 1
+        song_name = self.queue.pop(index)
+        self._log({"op": "pop", "index": index})
+        if index <= 1:
+            self._prefetch_next()
+        return song_name
 
     def skip(self):
         """Skip the currently playing song and schedule the next one in the queue."""
-        self.ctx.voice_client.stop()
-        # self.queue.pop(0)
+        self.voice_client.stop()
 
     # -vvv- events -vvv-
     async def on_player_start(self):
@@ -242,3 +596,7 @@ class MusicController:
     def __delattr__(self, __name: str) -> None:
         # TODO: remove next update task from event loop
         pass
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(MusicCog(bot, **get_options(__name__)))
@@ -1,11 +1,18 @@
+import asyncio
 import os
-from datetime import timezone
+import random
+from datetime import datetime, time, timedelta, timezone
+from time import perf_counter
+from typing import Any, Dict, Set, Tuple
 
 import aiocron
 import aiohttp
+import discord
 from discord import ChannelType
 from discord.ext import commands
 
+from lib.dispatch import Priority, get_dispatcher
+from lib.extensions import get_options, hand_over, is_reloading, take_over
 from lib.logging import get_logger
 
 
@@ -26,43 +33,147 @@ class QuotesCog(commands.Cog):
         self.logger.debug("Initializing QuotesCog...")
 
         self.bot = bot
-        self.base_url = "https://quotes.rest"
+        self.dispatcher = get_dispatcher()
+        self.base_url = os.environ.get("THEYSAIDSO_BASE_URL", "https://quotes.rest")
         self.api_token = os.environ.get("THEYSAIDSO_API_TOKEN")
+        self.session: aiohttp.ClientSession | None = None
+        self._cache: Dict[Tuple[str, str], Tuple[datetime, Any]] = {}
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        # guild ID -> IDs of its quote of the day channels, kept up to date by the
+        # guild and channel event listeners below
+        self.channel_name = "quote-of-the-day"
+        self.qod_channels: Dict[int, Set[int]] = {}
+        self.max_concurrent_sends = 10
+        self.qod_cron: aiocron.Cron | None = None
+
+    async def cog_load(self):
+        handed_over = take_over(__name__)
+        if handed_over:
+            # reloaded, keep the session (a quote of the day might be going out with
+            # it), the cached quotes and the channel index
+            self.session = handed_over["session"]
+            self._cache = handed_over["cache"]
+            self.qod_channels = handed_over["qod_channels"]
+        else:
+            if self.bot.is_ready():
+                # loaded after `on_ready`, so index the channels now
+                self.index_guilds()
+
+            # one long-lived session for the lifetime of the cog, so connections (and
+            # their DNS/TLS state) are reused between requests
+            connector = aiohttp.TCPConnector(
+                limit=10,
+                limit_per_host=4,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=30)
+            )
+
+        # started last, since a cog that fails to load is never unloaded, so its cron
+        # would never be stopped
         self.qod_cron = aiocron.crontab(
             "0 12 * * *", func=self.qod, loop=self.bot.loop, tz=timezone.utc
         )
 
-    async def make_request(self, url: str, method: str = "GET", **kwargs):
+    async def cog_unload(self):
+        # the next version of the cog starts a cron of its own
+        self.qod_cron.stop()
+        if is_reloading(__name__):
+            hand_over(
+                __name__,
+                {
+                    "session": self.session,
+                    "cache": self._cache,
+                    "qod_channels": self.qod_channels,
+                },
+            )
+            return
+        await self.session.close()
+
+    async def make_request(
+        self,
+        url: str,
+        method: str = "GET",
+        cache_until: datetime | None = None,
+        retries: int = 3,
+        **kwargs,
+    ):
+        """Makes a request to the API and returns the JSON response.
+
+        If `cache_until` is set, the response is cached until then, and concurrent
+        callers of the same URL share a single in-flight request. Connection errors,
+        rate limits and server errors are retried with jittered exponential backoff.
+        """
         if not self.api_token:
             raise Exception("No API token in environment")
 
-        session = aiohttp.ClientSession()
-
         full_url = f"{self.base_url}{url}"
 
-        try:
-            resp = await session.request(
-                method=method,
-                url=full_url,
-                headers={"X-TheySaidSo-Api-Secret": self.api_token},
-                **kwargs,
-            )
-            await session.close()
-            resp.raise_for_status()
-            return await resp.json()
-        except (
-            aiohttp.ClientError,
-            aiohttp.http_exceptions.HttpProcessingError,
-        ) as e:
-            status = getattr(e, "status", None)
-            message = getattr(e, "message", None)
-            self.logger.exception(
-                f"aiohttp exception occurred - {full_url} [{status}]: {message}"
-            )
-            raise
-        except Exception as e:
-            self.logger.exception("Non-aiohttp exception occurred")
-            raise
+        if cache_until is not None:
+            cached = self._cache.get((method, full_url))
+            if cached and cached[0] > datetime.now(timezone.utc):
+                return cached[1]
+
+            in_flight = self._in_flight.get((method, full_url))
+            if in_flight is None:
+                in_flight = asyncio.ensure_future(
+                    self._request(full_url, method, retries, **kwargs)
+                )
+                self._in_flight[(method, full_url)] = in_flight
+                in_flight.add_done_callback(
+                    lambda _: self._in_flight.pop((method, full_url), None)
+                )
+
+            data = await asyncio.shield(in_flight)
+            self._cache[(method, full_url)] = (cache_until, data)
+            return data
+
+        return await self._request(full_url, method, retries, **kwargs)
+
+    async def _request(self, full_url: str, method: str, retries: int, **kwargs):
+        for attempt in range(retries + 1):
+            retry_after = None
+            try:
+                async with self.session.request(
+                    method=method,
+                    url=full_url,
+                    headers={"X-TheySaidSo-Api-Secret": self.api_token},
+                    **kwargs,
+                ) as resp:
+                    if resp.status == 429 or resp.status >= 500:
+                        retry_after = resp.headers.get("Retry-After")
+                    resp.raise_for_status()
+                    return await resp.json()
+            except (
+                aiohttp.ClientError,
+                aiohttp.http_exceptions.HttpProcessingError,
+                asyncio.TimeoutError,
+            ) as e:
+                status = getattr(e, "status", None)
+                message = getattr(e, "message", None)
+
+                # other 4xx errors won't get any better by retrying
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == retries:
+                    self.logger.exception(
+                        f"aiohttp exception occurred - {full_url} [{status}]: {message}"
+                    )
+                    raise
+
+                delay = random.uniform(0.5, 1.5) * 2**attempt
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                self.logger.warning(
+                    f"Request failed - {full_url} [{status}]: {message}, retrying in "
+                    f"{delay:.1f} seconds ({attempt + 1}/{retries})"
+                )
+                await asyncio.sleep(delay)
+            except Exception as e:
+                self.logger.exception("Non-aiohttp exception occurred")
+                raise
 
     async def qod(self):
         """Check for a quote of the day channel and post a quote of the day in there
@@ -72,10 +183,14 @@ class QuotesCog(commands.Cog):
 
         # category = "all"
         category = "inspire"
-        channel_name = "quote-of-the-day"
 
         try:
-            resp = await self.make_request(f"/qod.json?category={category}")
+            # the quote of the day only changes once a day (UTC)
+            tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+            resp = await self.make_request(
+                f"/qod.json?category={category}",
+                cache_until=datetime.combine(tomorrow, time(), timezone.utc),
+            )
             self.logger.debug(resp)
             author = resp["contents"]["quotes"][0]["author"]
             quote = resp["contents"]["quotes"][0]["quote"]
@@ -83,7 +198,109 @@ class QuotesCog(commands.Cog):
             self.logger.exception("Failed to parse response for quote of the day")
             raise
 
+        await self.fan_out(f'*"{quote}"* - {author}')
+
+    async def fan_out(self, content: str):
+        """Sends `content` to every indexed quote of the day channel concurrently.
+
+        At most `max_concurrent_sends` sends are submitted at once, as bulk traffic to
+        the dispatcher, so reminders and responses to users go first. A failure in
+        one guild doesn't affect the others.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_sends)
+
+        async def send(channel_id: int) -> bool:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                return False
+            async with semaphore:
+                try:
+                    await self.dispatcher.send(
+                        channel, content, priority=Priority.BULK
+                    )
+                    return True
+                except discord.HTTPException:
+                    # logged by the dispatcher
+                    return False
+
+        channel_ids = [
+            channel_id
+            for channel_ids in self.qod_channels.values()
+            for channel_id in channel_ids
+        ]
+
+        start = perf_counter()
+        results = await asyncio.gather(*(send(channel_id) for channel_id in channel_ids))
+        duration = perf_counter() - start
+
+        self.logger.info(
+            f"Posted quote of the day to {sum(results)}/{len(channel_ids)} channels "
+            f"in {duration:.2f} seconds"
+        )
+
+    # -vvv- quote of the day channel index -vvv-
+    def index_guild(self, guild: discord.Guild):
+        """(Re)indexes the quote of the day channels of a guild."""
+        channel_ids = {
+            channel.id
+            for channel in guild.channels
+            if channel.type == ChannelType.text and channel.name == self.channel_name
+        }
+        if channel_ids:
+            self.qod_channels[guild.id] = channel_ids
+        else:
+            self.qod_channels.pop(guild.id, None)
+
+    def index_channel(self, channel: discord.abc.GuildChannel):
+        channel_ids = self.qod_channels.get(channel.guild.id, set())
+        if channel.type == ChannelType.text and channel.name == self.channel_name:
+            channel_ids.add(channel.id)
+        else:
+            channel_ids.discard(channel.id)
+
+        if channel_ids:
+            self.qod_channels[channel.guild.id] = channel_ids
+        else:
+            self.qod_channels.pop(channel.guild.id, None)
+
+    def index_guilds(self):
+        """Rebuilds the index from every guild the bot is in."""
+        self.qod_channels = {}
         for guild in self.bot.guilds:
-            for channel in guild.channels:
-                if channel.type == ChannelType.text and channel.name == channel_name:
-                    await channel.send(f'*"{quote}"* - {author}')
+            self.index_guild(guild)
+        self.logger.debug(
+            f"Indexed quote of the day channels in {len(self.qod_channels)} guilds"
+        )
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.index_guilds()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.index_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.qod_channels.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        self.index_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        self.index_channel(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        channel_ids = self.qod_channels.get(channel.guild.id, set())
+        channel_ids.discard(channel.id)
+        if not channel_ids:
+            self.qod_channels.pop(channel.guild.id, None)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(QuotesCog(bot, **get_options(__name__)))
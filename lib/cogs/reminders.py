@@ -1,17 +1,33 @@
 import asyncio
+import os
 from datetime import datetime, timedelta, timezone
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Tuple
 
-import dateparser
+import discord
 from discord import Interaction, app_commands
 from discord.ext import commands
-from google.cloud.firestore import DocumentReference, DocumentSnapshot, FieldFilter
 
+from lib.dispatch import Priority, get_dispatcher
+from lib.extensions import get_options, hand_over, is_reloading, take_over
 from lib.firebase import get_firestore
 from lib.logging import get_logger
+from lib.metrics import FIRESTORE_LATENCY, REMINDER_DRIFT, REMINDERS_PENDING
+from lib.startup import preload
 
+if TYPE_CHECKING:
+    from google.cloud.firestore import DocumentReference, DocumentSnapshot
 
-db = get_firestore()
+# initialized when the cog loads (see `RemindersCog.cog_load`), once per process
+db = None
+
+
+def _reset_db():
+    # gRPC channels don't survive a fork, so a forked process connects on its own
+    global db
+    db = None
+
+
+os.register_at_fork(after_in_child=_reset_db)
 
 
 class Member:
@@ -35,7 +51,7 @@ class Reminder:
         target_user: Member,
         content: str,
         dt: datetime,
-        _firestore_doc_ref: DocumentReference = None,
+        _firestore_doc_ref: "DocumentReference" = None,
     ) -> None:
         self.guild_id = guild_id
         self.channel_id = channel_id
@@ -47,7 +63,7 @@ class Reminder:
         self._firestore_doc_ref = _firestore_doc_ref
 
     @classmethod
-    def from_firestore(cls, snap: DocumentSnapshot):
+    def from_firestore(cls, snap: "DocumentSnapshot"):
         data = snap.to_dict()
         user = Member(data["user"]["id"], data["user"]["name"])
         target_user = Member(data["target_user"]["id"], data["target_user"]["name"])
@@ -71,14 +87,15 @@ class Reminder:
             "dt": self.dt,
         }
 
-    async def create(self) -> DocumentReference:
+    async def create(self) -> "DocumentReference":
         """Update or create the document if it doesn't exist. Soft fail if we are in an
         environment where Firebase/Firestore don't exist or can't be reached.
         """
         if db is None:
             return
 
-        result = await db.collection("reminders").add(self.to_dict())
+        with FIRESTORE_LATENCY.labels("add").time():
+            result = await db.collection("reminders").add(self.to_dict())
         self._firestore_doc_ref = result[1]
         return result[1]
 
@@ -93,7 +110,8 @@ class Reminder:
         if db is None:
             return
 
-        return await db.document("reminders", self._firestore_doc_ref.id).delete()
+        with FIRESTORE_LATENCY.labels("delete").time():
+            return await db.document("reminders", self._firestore_doc_ref.id).delete()
 
 
 class RemindersCog(commands.GroupCog, group_name="reminders"):
@@ -107,13 +125,73 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
 
         self.bot = bot
         self.loop = bot.loop
+        self.dispatcher = get_dispatcher()
         self.reminder_tasks: List[Tuple[Reminder, asyncio.Task]] = []
+        self._firestore_ready = asyncio.Event()
+        self._sync_reminders_task: asyncio.Task | None = None
+        REMINDERS_PENDING.set_function(lambda: len(self.reminder_tasks))
 
         # TODO: add a task to clean up any past/old reminders that didn't get deleted
 
-        # fetch reminders
+    async def cog_load(self):
+        handed_over = take_over(__name__)
+        if handed_over:
+            # reloaded, so there's no need to go back to Firestore, just reschedule
+            # the reminders the previous version of the cog had scheduled
+            global db
+            db = handed_over["db"]
+            self._firestore_ready.set()
+            for reminder in handed_over["reminders"]:
+                self.schedule_reminder(Reminder(**vars(reminder)))
+            return
+
+        # fetch reminders, connecting to Firestore first
         self._sync_reminders_task = self.loop.create_task(self.sync_reminders())
 
+    async def cog_unload(self):
+        synced = self._sync_reminders_task is None or self._sync_reminders_task.done()
+        if self._sync_reminders_task:
+            self._sync_reminders_task.cancel()
+
+        pending = []
+        now = datetime.now(timezone.utc)
+        for reminder, task in self.reminder_tasks:
+            # reminders that are due are being sent right now, let them finish
+            if task.done() or reminder.dt.replace(tzinfo=timezone.utc) <= now:
+                continue
+            task.cancel()
+            pending.append(reminder)
+        self.reminder_tasks = []
+
+        # if reminders are still being pulled in, the new version starts over
+        if is_reloading(__name__) and synced:
+            hand_over(__name__, {"db": db, "reminders": pending})
+
+    async def init_firestore(self):
+        """Initializes the Firestore client, in the background while the bot
+        connects to Discord.
+        """
+        global db
+        # importing firebase-admin (and gRPC) and looking up credentials can take
+        # seconds, as can importing dateparser, so do it all in threads instead of
+        # blocking the event loop. The client only connects on first use.
+        try:
+            client, preloaded = await asyncio.gather(
+                asyncio.to_thread(get_firestore),
+                preload("dateparser"),
+                return_exceptions=True,
+            )
+        finally:
+            # `create_reminder` waits on this, so it's set even if this failed
+            self._firestore_ready.set()
+
+        if isinstance(preloaded, Exception):
+            self.logger.error("Failed to preload dateparser!", exc_info=preloaded)
+        if isinstance(client, Exception):
+            self.logger.error("Failed to initialize Firestore!", exc_info=client)
+        else:
+            db = client
+
         if db is None:
             self.logger.warning(
                 "Couldn't initialize Firestore database! All reminders will be "
@@ -131,6 +209,9 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
         schedules them. Any reminder tasks that are currently scheduled are cancelled,
         repulled from Firestore, and rescheduled.
         """
+        if not self._firestore_ready.is_set():
+            await self.init_firestore()
+
         if db is None:
             self.logger.warning(
                 "Firestore database not initialized, skipping reminders synchronization"
@@ -150,15 +231,18 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
 
             self.reminder_tasks = []
 
+            from google.cloud.firestore import FieldFilter
+
             self.logger.debug(f"pulling reminders for {len(self.bot.guilds)} guilds...")
             reminders_count = 0
             for guild in self.bot.guilds:
-                reminders_snap_list = (
-                    await db.collection("reminders")
-                    .where(filter=FieldFilter("guild_id", "==", guild.id))
-                    .order_by("dt")
-                    .get()
-                )
+                with FIRESTORE_LATENCY.labels("query").time():
+                    reminders_snap_list = (
+                        await db.collection("reminders")
+                        .where(filter=FieldFilter("guild_id", "==", guild.id))
+                        .order_by("dt")
+                        .get()
+                    )
                 for reminder_snap in reminders_snap_list:
                     reminder = Reminder.from_firestore(reminder_snap)
                     reminders_count += 1
@@ -187,22 +271,32 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
                 )
                 return
 
+            due = reminder.dt.replace(tzinfo=timezone.utc)
             await asyncio.sleep(sleep_time)
+            REMINDER_DRIFT.observe((datetime.now(timezone.utc) - due).total_seconds())
 
             guild = await self.bot.fetch_guild(reminder.guild_id)
             channel = await guild.fetch_channel(reminder.channel_id)
 
             message = None
-            if reminder.target_user.id == reminder.user.id:
-                message = await channel.send(
-                    f"Hey, <@{reminder.user.id}>, you set a reminder for your self to "
-                    f"{reminder.content}"
-                )
-            else:
-                message = await channel.send(
-                    f"Hey, <@{reminder.target_user.id}>, <@{reminder.user.id}> is "
-                    f"reminding you to: *{reminder.content}*"
-                )
+            try:
+                if reminder.target_user.id == reminder.user.id:
+                    message = await self.dispatcher.send(
+                        channel,
+                        f"Hey, <@{reminder.user.id}>, you set a reminder for your "
+                        f"self to {reminder.content}",
+                        priority=Priority.CRITICAL,
+                    )
+                else:
+                    message = await self.dispatcher.send(
+                        channel,
+                        f"Hey, <@{reminder.target_user.id}>, <@{reminder.user.id}> "
+                        f"is reminding you to: *{reminder.content}*",
+                        priority=Priority.CRITICAL,
+                    )
+            except discord.HTTPException:
+                # logged by the dispatcher, the reminder stays in Firestore
+                return
 
             await reminder.delete()
 
@@ -232,6 +326,7 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
         """Creates and returns a `Reminder` instance, uploading it to Firestore in the
         process.
         """
+        await self._firestore_ready.wait()
         reminder = Reminder(guild_id, channel_id, user, target_user, content, dt)
         await reminder.create()
         return reminder
@@ -249,6 +344,10 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
         """Add a reminder for later.
         Example usage: `/reminders add @John make spaghetti in 1 hour`
         """
+        # Firestore might still be initializing (see `create_reminder`), which can
+        # take longer than Discord waits for a response
+        await interaction.response.defer(ephemeral=True)
+
         guild_id = interaction.guild.id
         channel_id = interaction.channel.id
         user = Member(interaction.user.id, interaction.user.name)
@@ -260,7 +359,7 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
             name = (await interaction.guild.fetch_member(id)).display_name
             target_user = Member(id, name)
         else:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f'Not sure who "{who}" is, try `/reminders add me <content> '
                 "<timeframe>` or `/reminders add @user <content> <timeframe>`",
                 ephemeral=True,
@@ -271,6 +370,8 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
             f"Creating new reminder in {interaction.guild.name}.{interaction.channel.name}"
         )
 
+        import dateparser
+
         # invert negative delta so that all reminders are in the future (even when
         # client submits something like !remind me 1 hour ago)
         now = datetime.utcnow()
@@ -286,11 +387,11 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
         # TODO: make the delta string nicer (e.g. "I'll remind you in 1 day", or
         # "I'll remind you in 2 hours", or "... in 15 days, 6 hours, and 15 minutes")
         if user == target_user:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"Gotcha! I'll remind you to {content} in {delta}.", ephemeral=True
             )
         else:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"Gotcha! I'll remind {target_user.name} to {content} in {delta}.",
                 ephemeral=True,
             )
@@ -355,3 +456,7 @@ class RemindersCog(commands.GroupCog, group_name="reminders"):
             f"Successfully deleted reminder: *{reminder[0].content}* (#{reminder_index}).",
             ephemeral=True,
         )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(RemindersCog(bot, **get_options(__name__)))
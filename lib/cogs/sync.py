@@ -4,8 +4,21 @@ import discord
 from discord.ext import commands
 from discord.ext.commands import Context, Greedy  # or a subclass of yours
 
+from lib.extensions import get_options
+from lib.tree_sync import TreeSyncer
+
 
 class SyncCog(commands.Cog):
+    """Syncs the application command tree. Syncs are skipped for scopes whose
+    commands haven't changed since they were last synced, unless `force` is given
+    (e.g. `!sync ~ force`).
+    """
+
+    def __init__(self, bot: commands.Bot) -> None:
+        super().__init__()
+        self.bot = bot
+        self.syncer = TreeSyncer(bot.tree)
+
     @commands.command()
     @commands.guild_only()
     @commands.is_owner()
@@ -14,32 +27,38 @@ class SyncCog(commands.Cog):
         ctx: Context,
         guilds: Greedy[discord.Object],
         spec: Optional[Literal["~", "*", "^"]] = None,
+        force: Optional[Literal["force"]] = None,
     ) -> None:
+        force = force is not None
         if not guilds:
             if spec == "~":
-                synced = await ctx.bot.tree.sync(guild=ctx.guild)
+                synced = await self.syncer.sync(ctx.guild, force)
             elif spec == "*":
                 ctx.bot.tree.copy_global_to(guild=ctx.guild)
-                synced = await ctx.bot.tree.sync(guild=ctx.guild)
+                synced = await self.syncer.sync(ctx.guild, force)
             elif spec == "^":
                 ctx.bot.tree.clear_commands(guild=ctx.guild)
-                await ctx.bot.tree.sync(guild=ctx.guild)
+                await self.syncer.sync(ctx.guild, force)
                 synced = []
             else:
-                synced = await ctx.bot.tree.sync()
+                synced = await self.syncer.sync(force=force)
 
-            await ctx.send(
-                f"Synced {len(synced)} commands {'globally' if spec is None else 'to the current guild.'}"
-            )
+            scope = "globally" if spec is None else "to the current guild"
+            if synced is None:
+                await ctx.send(
+                    f"Commands {scope} are already up to date, use `force` to sync "
+                    "anyway."
+                )
+            else:
+                await ctx.send(f"Synced {len(synced)} commands {scope}.")
             return
 
-        ret = 0
-        for guild in guilds:
-            try:
-                await ctx.bot.tree.sync(guild=guild)
-            except discord.HTTPException:
-                pass
-            else:
-                ret += 1
+        synced, skipped, failed = await self.syncer.sync_guilds(guilds, force)
+        await ctx.send(
+            f"Synced the tree to {synced}/{len(guilds)} ({skipped} already up to "
+            f"date, {failed} failed)."
+        )
+
 
-        await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
+async def setup(bot: commands.Bot):
+    await bot.add_cog(SyncCog(bot, **get_options(__name__)))
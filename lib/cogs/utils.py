@@ -1,19 +1,182 @@
-import json
-import os
+import asyncio
+from datetime import timezone
 
-from discord import ChannelType, File, Interaction, app_commands
+from discord import (
+    ChannelType,
+    File,
+    Interaction,
+    Member,
+    Message,
+    RawBulkMessageDeleteEvent,
+    RawMessageDeleteEvent,
+    TextChannel,
+    app_commands,
+)
 from discord.ext import commands
 
+from lib.counts import MessageCountIndex
+from lib.dispatch import Priority, get_dispatcher
+from lib.exports import GuildExport
+from lib.extensions import get_options, hand_over, is_reloading, take_over
+from lib.jobs import Job, JobPriority, JobQueue
+from lib.logging import get_logger
 from lib.permissions import GuildPermissions
+from lib.search import MessageSearchIndex
+from lib.startup import preload
 
 
 class UtilsCog(commands.GroupCog, group_name="utils"):
+    # message events keep the counters and the search index current, and edits of
+    # cached messages are re-indexed
+    gateway_intents = ("guild_messages", "message_content")
+    max_messages = 1000
+
+    def __init__(self, bot: commands.Bot) -> None:
+        super().__init__()
+
+        self.logger = get_logger(__name__)
+        self.logger.debug("Initializing UtilsCog...")
+
+        self.bot = bot
+        self.loop = bot.loop
+        self.dispatcher = get_dispatcher()
+
+        self._flush_task: asyncio.Task | None = None
+
+        # reloaded, so keep the counters, the open search databases and any running
+        # jobs (e.g. exports) of the previous version of the cog
+        self._handed_over = take_over(__name__)
+        if self._handed_over:
+            self.message_counts = self._handed_over["message_counts"]
+            self.search_index = self._handed_over["search_index"]
+            self.job_queue = self._handed_over["job_queue"]
+            return
+
+        self.message_counts = MessageCountIndex()
+        self.search_index = MessageSearchIndex()
+
+        # heavy history scans run as background jobs, so they can't starve the rest
+        # of the bot of its REST budget
+        self.job_queue = JobQueue(max_workers=4, per_guild=1)
+
+    async def cog_load(self):
+        # dateparser is slow to import and only used by `search`, import it in the
+        # background (while the bot connects) rather than on the first search
+        self._preload_task = self.loop.create_task(preload("dateparser"))
+        # the counters have to be loaded before any message events come in
+        if not self._handed_over:
+            await asyncio.to_thread(self.message_counts.load)
+        self._flush_task = self.loop.create_task(self.flush_counts())
+
+    async def cog_unload(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+        self.message_counts.flush()
+        if is_reloading(__name__):
+            hand_over(
+                __name__,
+                {
+                    "message_counts": self.message_counts,
+                    "search_index": self.search_index,
+                    "job_queue": self.job_queue,
+                },
+            )
+            return
+        self.job_queue.shutdown()
+        self.search_index.close()
+
+    async def flush_counts(self, interval: int = 30):
+        """Periodically persists the message counters to disk."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.message_counts.flush()
+            except OSError:
+                self.logger.exception("Failed to persist message counters!")
+
+    def submit_catch_up(self, name: str, guild_id: int, func):
+        """Queues a catch up job, unless one is still pending or running (e.g.
+        because `on_ready` fired again after a reconnect).
+        """
+        for job in self.job_queue.get_jobs(guild_id):
+            if job.name == name and not job.is_finished:
+                return
+        self.job_queue.submit(name, guild_id, self.bot.user.id, func, JobPriority.BULK)
+
+    async def wait_for_job(self, interaction: Interaction, job: Job):
+        """Waits for a job started from a deferred interaction. Returns `None` (after
+        letting the user know) if the job failed or was cancelled.
+        """
+        try:
+            return await job.wait()
+        except asyncio.CancelledError:
+            if not job.is_finished:
+                raise
+            await interaction.followup.send(f"Job #{job.id} was cancelled.")
+        except Exception:
+            await interaction.followup.send(f"Job #{job.id} failed, sorry :(")
+        return None
+
+    # -vvv- event listeners -vvv-
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # only the gap since the last time the bot was online needs to be counted
+        # and indexed, one job per guild so the per-guild cap applies
+        counted_guild_ids = {
+            counts.guild_id for counts in self.message_counts.channels.values()
+        }
+        for guild_id in counted_guild_ids:
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None:
+                self.submit_catch_up(
+                    "catch up message counters",
+                    guild_id,
+                    lambda guild=guild: self.message_counts.catch_up_guild(guild),
+                )
+        for guild_id in list(self.search_index.guild_ids):
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None:
+                self.submit_catch_up(
+                    "catch up search index",
+                    guild_id,
+                    lambda guild=guild: self.search_index.catch_up(guild),
+                )
+
+    @commands.Cog.listener()
+    async def on_message(self, message: Message):
+        self.message_counts.on_message(message)
+        await self.search_index.on_message(message)
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, before: Message, after: Message):
+        await self.search_index.on_message_edit(after)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: RawMessageDeleteEvent):
+        self.message_counts.on_message_delete(
+            payload.channel_id, payload.message_id, payload.cached_message
+        )
+        await self.search_index.on_message_delete(
+            payload.guild_id, [payload.message_id]
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: RawBulkMessageDeleteEvent):
+        cached_messages = {message.id: message for message in payload.cached_messages}
+        for message_id in payload.message_ids:
+            self.message_counts.on_message_delete(
+                payload.channel_id, message_id, cached_messages.get(message_id)
+            )
+        await self.search_index.on_message_delete(payload.guild_id, payload.message_ids)
+
+    # -vvv- commands -vvv-
     @app_commands.command()
     @app_commands.check(GuildPermissions.is_owner)
     async def exit(self, interaction: Interaction):
         """Command which forcefully kills the bot."""
         # NOTE: only actually restarts if running in a container with a retart policy
         await interaction.response.send_message("Restarting!")
+        self.message_counts.flush()
         exit(0)
 
     @app_commands.command()
@@ -21,12 +184,25 @@ class UtilsCog(commands.GroupCog, group_name="utils"):
     async def count(self, interaction: Interaction):
         """Returns total number of text messages from author in a channel."""
         await interaction.response.defer()
-        count = 0
         channel = interaction.channel
         author = interaction.user
-        async for message in channel.history(limit=None):
-            if message.author == author:
-                count += 1
+
+        if self.message_counts.is_seeded(channel.id):
+            count = await self.message_counts.author_count(channel, author.id)
+        else:
+            # the channel has never been counted (a full history scan) or has yet to
+            # catch up on the messages sent while the bot was offline
+            job = self.job_queue.submit(
+                f"count #{channel.name}",
+                interaction.guild.id,
+                author.id,
+                lambda: self.message_counts.author_count(channel, author.id),
+                JobPriority.INTERACTIVE,
+            )
+            count = await self.wait_for_job(interaction, job)
+            if count is None:
+                return
+
         await interaction.followup.send(
             f"{author.mention} has {count} total text messages in this channel."
         )
@@ -36,10 +212,24 @@ class UtilsCog(commands.GroupCog, group_name="utils"):
     async def channel_count(self, interaction: Interaction):
         """Returns total number of text messages in a channel."""
         await interaction.response.defer()
-        count = 0
         channel = interaction.channel
-        async for message in channel.history(limit=None):
-            count += 1
+
+        if self.message_counts.is_seeded(channel.id):
+            count = await self.message_counts.channel_count(channel)
+        else:
+            # the channel has never been counted (a full history scan) or has yet to
+            # catch up on the messages sent while the bot was offline
+            job = self.job_queue.submit(
+                f"channel_count #{channel.name}",
+                interaction.guild.id,
+                interaction.user.id,
+                lambda: self.message_counts.channel_count(channel),
+                JobPriority.INTERACTIVE,
+            )
+            count = await self.wait_for_job(interaction, job)
+            if count is None:
+                return
+
         await interaction.followup.send(
             f"There are a total of {count} text messages in the channel."
         )
@@ -48,49 +238,169 @@ class UtilsCog(commands.GroupCog, group_name="utils"):
     @app_commands.check(GuildPermissions.is_owner)
     async def export_guild(self, interaction: Interaction):
         """Returns all the messages from all the channels in a Discord guild."""
-        await interaction.response.defer()
+        job = self.job_queue.submit(
+            "export_guild",
+            interaction.guild.id,
+            interaction.user.id,
+            lambda: self._export_guild(interaction),
+            JobPriority.BULK,
+        )
+        await interaction.response.send_message(
+            f"Queued the export as job #{job.id}, I'll DM you when it's done. "
+            "Use `/utils jobs` to check on it."
+        )
 
+    async def _export_guild(self, interaction: Interaction):
         text_channels = []
         for channel in interaction.guild.channels:
             if channel.type == ChannelType.text:
                 text_channels.append(channel)
 
-        exported_messages = []
+        # resume from (or incrementally extend) the previous export, if there is one
+        export = GuildExport(interaction.guild.id)
+        await asyncio.to_thread(export.load)
+
+        new_messages = 0
         for channel in text_channels:
-            async for message in channel.history(limit=None):
-                channel_name = channel.name
-                author = message.author
-                content = message.content
-                attachments = message.attachments
-                created_at = message.created_at
-                exported_messages.append(
-                    {
-                        "channel_name": channel_name,
-                        "author_name": author.name,
-                        "content": content,
-                        "created_at": created_at.isoformat(),
-                    }
-                )
+            new_messages += await export.export_channel(channel)
 
-        # make sure path exists
-        exports_dir = f"{os.getcwd()}/exports"
-        if not os.path.exists(exports_dir):
-            os.makedirs(exports_dir)
-
-        filename = f"exports/{interaction.guild.id}-export.json"
-        file = open(
-            file=filename,
-            mode="w",
-            encoding="utf_8",
-            errors="strict",
-        )
-        json.dump(exported_messages, file, indent=4)
-        file.close()
+        total_messages = await asyncio.to_thread(export.write_export)
 
         success_text = (
-            f"Successfully extracted {len(exported_messages)} messages "
+            f"Successfully extracted {total_messages} messages ({new_messages} new) "
             f"from {len(text_channels)} channels. Check your DMs!"
         )
 
-        await interaction.followup.send(success_text)
-        await interaction.user.send(file=File(filename))
+        await self.dispatcher.send(interaction.channel, success_text)
+        # the export can be big, and nobody's waiting on it (the user was told to
+        # check their DMs), so it goes out as bulk traffic
+        await self.dispatcher.send(
+            interaction.user, file=File(export.export_path), priority=Priority.BULK
+        )
+
+    @app_commands.command()
+    @app_commands.check(GuildPermissions.is_owner)
+    async def index_guild(self, interaction: Interaction):
+        """Builds (or catches up) the local search index for this guild."""
+        job = self.job_queue.submit(
+            "index_guild",
+            interaction.guild.id,
+            interaction.user.id,
+            lambda: self._index_guild(interaction),
+            JobPriority.BULK,
+        )
+        await interaction.response.send_message(
+            f"Queued indexing as job #{job.id}. Use `/utils jobs` to check on it."
+        )
+
+    async def _index_guild(self, interaction: Interaction):
+        text_channels = []
+        for channel in interaction.guild.channels:
+            if channel.type == ChannelType.text:
+                text_channels.append(channel)
+
+        indexed_messages = 0
+        for channel in text_channels:
+            indexed_messages += await self.search_index.backfill(channel)
+
+        await self.dispatcher.send(
+            interaction.channel,
+            f"Indexed {indexed_messages} new messages from {len(text_channels)} "
+            "channels. Use `/utils search` to search them!",
+        )
+
+    @app_commands.command()
+    @app_commands.check(GuildPermissions.is_admin)
+    async def jobs(self, interaction: Interaction):
+        """Shows the running, queued and recently finished jobs in this guild."""
+        jobs = self.job_queue.get_jobs(interaction.guild.id)
+
+        if len(jobs) == 0:
+            await interaction.response.send_message("No jobs.", ephemeral=True)
+            return
+
+        list_str = "Jobs in this guild:\n"
+        for job in jobs:
+            list_str += f"> {job} (started by <@{job.user_id}>)\n"
+
+        await interaction.response.send_message(list_str.strip(), ephemeral=True)
+
+    @app_commands.command()
+    @app_commands.check(GuildPermissions.is_admin)
+    async def cancel_job(self, interaction: Interaction, job_id: int):
+        """Cancels a queued or running job (run `/utils jobs` first to get the ID)."""
+        job = self.job_queue.jobs.get(job_id)
+        if job is None or job.guild_id != interaction.guild.id:
+            job = None
+        else:
+            job = self.job_queue.cancel(job_id)
+
+        if job is None:
+            await interaction.response.send_message(
+                f"There is no unfinished job #{job_id} in this guild.", ephemeral=True
+            )
+        else:
+            await interaction.response.send_message(f"Cancelled job #{job_id}.")
+
+    @app_commands.command()
+    @app_commands.guild_only()
+    async def search(
+        self,
+        interaction: Interaction,
+        query: str,
+        author: Member | None = None,
+        channel: TextChannel | None = None,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        """Searches this guild's messages. Dates can be things like "2 weeks ago"."""
+        # only search channels the user is allowed to read
+        channels = [channel] if channel else interaction.guild.text_channels
+        channel_ids = [
+            c.id
+            for c in channels
+            if c.permissions_for(interaction.user).read_message_history
+        ]
+
+        import dateparser
+
+        after_dt = after and dateparser.parse(after, settings={"TIMEZONE": "UTC"})
+        before_dt = before and dateparser.parse(before, settings={"TIMEZONE": "UTC"})
+        if (after and after_dt is None) or (before and before_dt is None):
+            await interaction.response.send_message(
+                "Couldn't understand that date, try something like `2023-06-01` or "
+                "`3 days ago`.",
+                ephemeral=True,
+            )
+            return
+
+        results = await self.search_index.search(
+            interaction.guild.id,
+            query,
+            channel_ids,
+            author_id=author and author.id,
+            after=after_dt and after_dt.replace(tzinfo=timezone.utc),
+            before=before_dt and before_dt.replace(tzinfo=timezone.utc),
+        )
+
+        if len(results) == 0:
+            await interaction.response.send_message(
+                "No messages found. If this guild hasn't been indexed yet, an owner "
+                "can run `/utils index_guild` first.",
+                ephemeral=True,
+            )
+            return
+
+        list_str = f"Top {len(results)} results for *{query}*:\n"
+        for index, result in enumerate(results):
+            list_str += (
+                f"> {index + 1}. **{result.author_name}** "
+                f"<t:{int(result.created_at.timestamp())}:d> {result.jump_url}\n"
+                f"> {result.snippet}\n"
+            )
+
+        await interaction.response.send_message(list_str.strip()[:2000], ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(UtilsCog(bot, **get_options(__name__)))
@@ -1,8 +1,11 @@
 import asyncio
+import weakref
+from typing import Dict, List, Tuple
 
 import discord
 from discord.ext import commands
 
+from lib.audio import is_playing_music
 from lib.logging import get_logger
 
 logger = get_logger(__name__)
@@ -28,9 +31,10 @@ async def join_users_vc(
     except discord.ClientException:
         # already in a voice channel, move to new channel
         await ctx.voice_client.move_to(ctx.author.voice.channel)
-        # NOTE: calling stop just in case something is already playing, but there may
-        # be circumstances where we don't want to call this
-        ctx.voice_client.stop()
+        # NOTE: calling stop just in case something is already playing, unless it's
+        # music, which other sounds get mixed into instead (see `play_effect`)
+        if not is_playing_music(ctx.voice_client):
+            ctx.voice_client.stop()
         return ctx.voice_client
     except asyncio.TimeoutError:
         err_msg = "Couldn't connect to the voice client in time"
@@ -49,3 +53,81 @@ async def join_users_vc(
         raise
 
     return None
+
+
+async def leave_vc(voice_client: discord.VoiceClient):
+    """Disconnects from voice, unless music is playing (which should keep going)."""
+    if not is_playing_music(voice_client):
+        await voice_client.disconnect()
+
+
+# at most this many voice moves/disconnects per guild are in flight at once, which
+# keeps bulk moves within the guild's member edit rate limit
+voice_move_concurrency = 5
+# only kept while moves are using them, so guilds don't accumulate
+_voice_move_semaphores: "weakref.WeakValueDictionary[int, asyncio.Semaphore]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+async def move_members(
+    moves: List[Tuple[discord.Member, discord.VoiceChannel | None, float]]
+):
+    """Moves members to a voice channel (or disconnects them, if the channel is
+    `None`) `delay` seconds from now, given as `(member, channel, delay)` tuples.
+
+    Every move is scheduled concurrently on its own timestamp, so effects land on
+    time (e.g. in sync with a sound) no matter how many members are being moved.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def move(member: discord.Member, channel: discord.VoiceChannel | None, delay):
+        semaphore = _voice_move_semaphores.get(member.guild.id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(voice_move_concurrency)
+            _voice_move_semaphores[member.guild.id] = semaphore
+        await asyncio.sleep(max(start + delay - loop.time(), 0))
+        async with semaphore:
+            try:
+                await member.edit(voice_channel=channel)
+            except discord.HTTPException:
+                logger.exception(f"Failed to move {member} to {channel}")
+
+    await asyncio.gather(*(move(*m) for m in moves))
+
+
+def connectable_channels(
+    members: List[discord.Member], channels: List[discord.VoiceChannel]
+) -> Dict[int, List[discord.VoiceChannel]]:
+    """Returns the channels each member is allowed to connect to, keyed by member ID.
+
+    Permissions are resolved once per channel and distinct set of roles rather than
+    once per member, except for members that have member-specific overwrites.
+    """
+    members_with_overwrites = {
+        target.id
+        for channel in channels
+        for target in channel.overwrites
+        if isinstance(target, discord.Member)
+    }
+
+    cache: Dict[tuple, List[discord.VoiceChannel]] = {}
+    available_channels = {}
+    for member in members:
+        if member.id in members_with_overwrites:
+            key = ("member", member.id)
+        else:
+            key = (
+                frozenset(role.id for role in member.roles),
+                member.id == member.guild.owner_id,
+                member.is_timed_out(),
+            )
+
+        if key not in cache:
+            cache[key] = [
+                channel for channel in channels if channel.permissions_for(member).connect
+            ]
+        available_channels[member.id] = cache[key]
+
+    return available_channels
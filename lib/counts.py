@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+from collections import Counter
+from typing import Dict, Set
+
+import discord
+from discord.utils import time_snowflake, utcnow
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+async def count_history_sliced(
+    channel: discord.TextChannel, slices: int = 8
+) -> tuple[Counter, int]:
+    """Counts every message in a channel by splitting its lifetime (from
+    `channel.created_at` until now) into `slices` time ranges and fetching them
+    concurrently with `history(after=..., before=...)`.
+
+    Returns the number of messages per author ID and the ID of the newest message
+    that was counted.
+    """
+    start = channel.created_at
+    step = (utcnow() - start) / slices
+
+    # snowflake boundaries for each slice, the last slice is left open ended so
+    # messages sent during the scan aren't missed
+    boundaries = [channel.id] + [
+        time_snowflake(start + step * i) for i in range(1, slices)
+    ]
+
+    async def count_slice(index: int) -> tuple[Counter, int]:
+        after = discord.Object(id=boundaries[index])
+        before = None
+        if index + 1 < len(boundaries):
+            before = discord.Object(id=boundaries[index + 1] + 1)
+
+        authors = Counter()
+        last_message_id = 0
+        async for message in channel.history(limit=None, after=after, before=before):
+            authors[message.author.id] += 1
+            last_message_id = max(last_message_id, message.id)
+        return authors, last_message_id
+
+    results = await asyncio.gather(*(count_slice(i) for i in range(slices)))
+
+    authors = Counter()
+    last_message_id = 0
+    for slice_authors, slice_last_message_id in results:
+        authors.update(slice_authors)
+        last_message_id = max(last_message_id, slice_last_message_id)
+    return authors, last_message_id
+
+
+class ChannelCounts:
+    """Message counters for a single channel, valid up to `last_message_id`."""
+
+    def __init__(
+        self,
+        guild_id: int,
+        total: int = 0,
+        authors: Dict[int, int] | None = None,
+        last_message_id: int = 0,
+        seeded: bool = False,
+    ) -> None:
+        self.guild_id = guild_id
+        self.total = total
+        self.authors = Counter(authors or {})
+        self.last_message_id = last_message_id
+        self.seeded = seeded
+
+        # set while history is being scanned, live events are ignored in the meantime
+        # and picked up by another pass of the scan instead
+        self.syncing = False
+        self.missed_events = False
+        self.lock = asyncio.Lock()
+        # set for counters loaded from disk until they're caught up, live events are
+        # ignored in the meantime too, since counting one would move
+        # `last_message_id` past the messages sent while the bot was offline
+        self.stale = False
+
+    @classmethod
+    def from_dict(cls, guild_id: int, data: dict):
+        return cls(
+            guild_id,
+            data["total"],
+            {int(author_id): count for author_id, count in data["authors"].items()},
+            data["last_message_id"],
+            data["seeded"],
+        )
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "authors": {str(author_id): count for author_id, count in self.authors.items()},
+            "last_message_id": self.last_message_id,
+            "seeded": self.seeded,
+        }
+
+
+class MessageCountIndex:
+    """Per-channel and per-author message counters, kept current by gateway events.
+
+    A channel is seeded once by scanning its history, after which `on_message` and
+    message delete events keep the counters up to date. Counters are persisted per
+    guild (`data/counts/{guild_id}.json`) along with the last seen message ID, so
+    after a restart only the messages sent while the bot was offline need to be
+    fetched. Deletes that happen while offline can't be observed and are not
+    reflected in the counts.
+
+    Channels that have never been counted are seeded with `count_history_sliced`,
+    scanning `seed_slices` time ranges of the channel's history concurrently.
+    """
+
+    def __init__(self, data_dir: str | None = None, seed_slices: int = 8) -> None:
+        self.data_dir = data_dir or f"{os.getcwd()}/data/counts"
+        self.seed_slices = seed_slices
+        self.channels: Dict[int, ChannelCounts] = {}
+        self._dirty_guilds: Set[int] = set()
+
+    # -vvv- persistence -vvv-
+    def load(self):
+        """Loads all persisted guild counters from disk."""
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        for filename in os.listdir(self.data_dir):
+            if not filename.endswith(".json"):
+                continue
+            guild_id = int(filename.removesuffix(".json"))
+            with open(f"{self.data_dir}/{filename}", encoding="utf_8") as file:
+                data = json.load(file)
+            for channel_id, channel_data in data.items():
+                counts = ChannelCounts.from_dict(guild_id, channel_data)
+                counts.stale = True
+                self.channels[int(channel_id)] = counts
+
+        logger.debug(f"Loaded message counters for {len(self.channels)} channels")
+
+    def flush(self):
+        """Writes the counters of every guild that changed since the last flush."""
+        dirty_guilds, self._dirty_guilds = self._dirty_guilds, set()
+        for guild_id in dirty_guilds:
+            data = {
+                str(channel_id): counts.to_dict()
+                for channel_id, counts in self.channels.items()
+                if counts.guild_id == guild_id and counts.seeded
+            }
+            path = f"{self.data_dir}/{guild_id}.json"
+            with open(f"{path}.tmp", mode="w", encoding="utf_8") as file:
+                json.dump(data, file)
+            os.replace(f"{path}.tmp", path)
+
+    # -vvv- history scanning -vvv-
+    async def catch_up(self, channel: discord.TextChannel):
+        """Counts every message newer than the channel's last seen message. Seeds the
+        channel if it has never been counted before.
+        """
+        counts = self.channels.get(channel.id)
+        if counts is None:
+            counts = ChannelCounts(channel.guild.id)
+            self.channels[channel.id] = counts
+
+        async with counts.lock:
+            counts.syncing = True
+            try:
+                if counts.last_message_id == 0 and self.seed_slices > 1:
+                    authors, last_message_id = await count_history_sliced(
+                        channel, self.seed_slices
+                    )
+                    counts.authors.update(authors)
+                    counts.total += sum(authors.values())
+                    counts.last_message_id = last_message_id
+
+                while True:
+                    counts.missed_events = False
+                    after = discord.Object(id=counts.last_message_id)
+                    async for message in channel.history(
+                        limit=None, after=after, oldest_first=True
+                    ):
+                        self._count(counts, message)
+                    # messages that arrived during the scan might've been missed by
+                    # the last history page, so do another (cheap) pass for those
+                    if not counts.missed_events:
+                        break
+            finally:
+                counts.syncing = False
+
+            counts.seeded = True
+            counts.stale = False
+            self._dirty_guilds.add(counts.guild_id)
+
+    async def catch_up_guild(self, guild: discord.Guild):
+        """Catches up every seeded channel of `guild` the bot can still see."""
+        for channel_id, counts in list(self.channels.items()):
+            if counts.guild_id != guild.id or not counts.seeded:
+                continue
+            channel = guild.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await self.catch_up(channel)
+            except discord.HTTPException:
+                logger.exception(f"Failed to catch up message counters for {channel_id}")
+
+    # -vvv- queries -vvv-
+    def is_seeded(self, channel_id: int) -> bool:
+        """Whether a channel's counts can be answered without scanning history."""
+        counts = self.channels.get(channel_id)
+        return counts is not None and counts.seeded and not counts.stale
+
+    async def channel_count(self, channel: discord.TextChannel) -> int:
+        """Returns the total number of messages in a channel."""
+        counts = await self._get_seeded(channel)
+        return counts.total
+
+    async def author_count(self, channel: discord.TextChannel, author_id: int) -> int:
+        """Returns the number of messages from an author in a channel."""
+        counts = await self._get_seeded(channel)
+        return counts.authors[author_id]
+
+    async def _get_seeded(self, channel: discord.TextChannel) -> ChannelCounts:
+        counts = self.channels.get(channel.id)
+        if counts is None or not counts.seeded or counts.stale:
+            await self.catch_up(channel)
+            counts = self.channels[channel.id]
+        return counts
+
+    # -vvv- gateway events -vvv-
+    def on_message(self, message: discord.Message):
+        counts = self.channels.get(message.channel.id)
+        if counts is None:
+            return
+        if counts.syncing or counts.stale:
+            counts.missed_events = True
+            return
+        if counts.seeded:
+            self._count(counts, message)
+            self._dirty_guilds.add(counts.guild_id)
+
+    def on_message_delete(
+        self, channel_id: int, message_id: int, message: discord.Message | None
+    ):
+        """Uncounts a deleted message. The author's counter can only be adjusted if
+        the message was still in the client's message cache.
+        """
+        counts = self.channels.get(channel_id)
+        if counts is None or not counts.seeded or message_id > counts.last_message_id:
+            return
+
+        counts.total = max(counts.total - 1, 0)
+        if message is not None and counts.authors[message.author.id] > 0:
+            counts.authors[message.author.id] -= 1
+        self._dirty_guilds.add(counts.guild_id)
+
+    def _count(self, counts: ChannelCounts, message: discord.Message):
+        if message.id <= counts.last_message_id:
+            return
+        counts.total += 1
+        counts.authors[message.author.id] += 1
+        counts.last_message_id = message.id
@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import itertools
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+import discord
+
+from lib.logging import get_logger
+from lib.metrics import DISPATCHED, DISPATCH_COALESCED, DISPATCH_QUEUED
+
+logger = get_logger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes of outbound actions, lower goes first."""
+
+    # things that have to go out on time, e.g. reminders
+    CRITICAL = 0
+    # responses to something a user just did, e.g. reactions, "now playing"
+    INTERACTIVE = 1
+    # everything that can wait, e.g. quote of the day fan out, export DMs
+    BULK = 2
+
+
+class _Action:
+    __slots__ = ("bucket", "func", "priority", "key", "seq", "future")
+
+    def __init__(
+        self,
+        bucket: Hashable,
+        func: Callable[[], Awaitable],
+        priority: Priority,
+        key: Hashable | None,
+        seq: int,
+        future: asyncio.Future,
+    ) -> None:
+        self.bucket = bucket
+        self.func = func
+        self.priority = priority
+        self.key = key
+        self.seq = seq
+        self.future = future
+
+    def __lt__(self, other: "_Action"):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Bucket:
+    __slots__ = ("queue", "busy")
+
+    def __init__(self) -> None:
+        self.queue: List[_Action] = []
+        self.busy = False
+
+
+class Dispatcher:
+    """Runs outbound Discord REST actions (sends, reactions, DMs) submitted by every
+    cog, highest priority first.
+
+    Actions are queued per bucket, which should match Discord's rate limit buckets
+    (e.g. one per channel), and only one action per bucket runs at a time, so one
+    busy channel can't hold up the rest. Bulk actions can use at most `bulk_limit`
+    of the `max_concurrency` workers, and once `max_bulk_queued` of them are
+    waiting, `run` makes bulk submitters wait for space.
+
+    Actions submitted with a `key` supersede a queued (not yet started) action with
+    the same key, e.g. a "now playing" message that's already out of date. With
+    `undo=True`, the new action instead cancels the queued one out and both are
+    dropped, e.g. removing a reaction that hasn't been added yet. Superseded
+    actions resolve to `None`.
+
+    Failed actions are logged here, so callers don't need to log them again.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        bulk_limit: int | None = None,
+        max_bulk_queued: int = 1000,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.bulk_limit = bulk_limit or max(max_concurrency - 2, 1)
+        self.max_bulk_queued = max_bulk_queued
+
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        # heads of the queues of idle buckets, as (priority, seq, bucket)
+        self._ready: List[Tuple[int, int, Hashable]] = []
+        self._keyed: Dict[Hashable, _Action] = {}
+        self._seq = itertools.count()
+        self._bulk_queued = 0
+        self._bulk_running = 0
+
+        self._wakeup = asyncio.Event()
+        self._bulk_space = asyncio.Event()
+        self._bulk_space.set()
+        self._workers: List[asyncio.Task] = []
+        self._closed = False
+        DISPATCH_QUEUED.set_function(lambda: self.queued)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(bucket.queue) for bucket in self._buckets.values())
+
+    def _start_workers(self):
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [
+                loop.create_task(self._work()) for _ in range(self.max_concurrency)
+            ]
+
+    def submit(
+        self,
+        bucket: Hashable,
+        func: Callable[[], Awaitable],
+        priority: Priority = Priority.INTERACTIVE,
+        key: Hashable | None = None,
+        undo: bool = False,
+    ) -> asyncio.Future:
+        """Queues `func` (called with no arguments, returning an awaitable) to run in
+        `bucket`. Returns a future resolving to its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # don't complain about failures nobody awaited, they're logged already
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self._closed:
+            future.cancel()
+            return future
+        self._start_workers()
+
+        if key is not None:
+            superseded = self._keyed.pop(key, None)
+            if superseded is not None:
+                self._drop(superseded)
+                if undo:
+                    DISPATCH_COALESCED.labels(priority.name).inc()
+                    future.set_result(None)
+                    return future
+
+        action = _Action(bucket, func, priority, key, next(self._seq), future)
+        if key is not None:
+            self._keyed[key] = action
+        if priority == Priority.BULK:
+            self._bulk_queued += 1
+            if self._bulk_queued >= self.max_bulk_queued:
+                self._bulk_space.clear()
+
+        state = self._buckets.setdefault(bucket, _Bucket())
+        heapq.heappush(state.queue, action)
+        if not state.busy and state.queue[0] is action:
+            heapq.heappush(self._ready, (priority, action.seq, bucket))
+            self._wakeup.set()
+        return future
+
+    async def run(
+        self,
+        bucket: Hashable,
+        func: Callable[[], Awaitable],
+        priority: Priority = Priority.INTERACTIVE,
+        key: Hashable | None = None,
+    ) -> Any:
+        """Submits `func` and waits for its result. Bulk submitters wait for space in
+        the queue first, so bulk traffic absorbs the backpressure.
+        """
+        if priority == Priority.BULK:
+            while not self._bulk_space.is_set():
+                await self._bulk_space.wait()
+        return await self.submit(bucket, func, priority, key)
+
+    def _drop(self, action: _Action):
+        state = self._buckets[action.bucket]
+        state.queue.remove(action)
+        heapq.heapify(state.queue)
+        self._action_done(action)
+        DISPATCH_COALESCED.labels(action.priority.name).inc()
+        action.future.set_result(None)
+
+        # the dropped action might've been the bucket's head
+        if state.queue and not state.busy:
+            head = state.queue[0]
+            heapq.heappush(self._ready, (head.priority, head.seq, action.bucket))
+        elif not state.queue and not state.busy:
+            del self._buckets[action.bucket]
+
+    def _action_done(self, action: _Action):
+        if action.priority == Priority.BULK:
+            self._bulk_queued -= 1
+            if self._bulk_queued < self.max_bulk_queued:
+                self._bulk_space.set()
+
+    def _next_action(self) -> _Action | None:
+        while self._ready:
+            priority, seq, bucket = self._ready[0]
+            state = self._buckets.get(bucket)
+            # skip stale entries, e.g. for heads that were dropped
+            if state is None or state.busy or not state.queue:
+                heapq.heappop(self._ready)
+                continue
+            if state.queue[0].seq != seq:
+                heapq.heappop(self._ready)
+                continue
+            if priority == Priority.BULK and self._bulk_running >= self.bulk_limit:
+                # leave the remaining workers to higher priority actions
+                return None
+
+            heapq.heappop(self._ready)
+            state.busy = True
+            action = heapq.heappop(state.queue)
+            if action.key is not None and self._keyed.get(action.key) is action:
+                del self._keyed[action.key]
+            return action
+        return None
+
+    async def _work(self):
+        while True:
+            action = self._next_action()
+            if action is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if action.priority == Priority.BULK:
+                self._bulk_running += 1
+            try:
+                result = await action.func()
+            except Exception as e:
+                logger.exception(f"Dispatched action in {action.bucket} failed")
+                action.future.set_exception(e)
+            except asyncio.CancelledError:
+                action.future.cancel()
+                # the worker itself is only cancelled on shutdown, otherwise the
+                # action cancelled itself and the worker carries on
+                if self._closed:
+                    raise
+            else:
+                action.future.set_result(result)
+                DISPATCHED.labels(action.priority.name).inc()
+            finally:
+                # e.g. interrupted by another `BaseException`, nobody should be left
+                # waiting on it
+                if not action.future.done():
+                    action.future.cancel()
+                if action.priority == Priority.BULK:
+                    self._bulk_running -= 1
+                if self._closed:
+                    # `shutdown` already cleared the queues
+                    return
+                self._action_done(action)
+
+                state = self._buckets[action.bucket]
+                state.busy = False
+                if state.queue:
+                    head = state.queue[0]
+                    heapq.heappush(self._ready, (head.priority, head.seq, head.bucket))
+                else:
+                    del self._buckets[action.bucket]
+                # a worker might be waiting on this bucket, or on a bulk slot
+                self._wakeup.set()
+
+    def shutdown(self):
+        """Stops the workers and cancels every queued action. Actions submitted
+        afterwards are cancelled right away.
+        """
+        self._closed = True
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+        for state in self._buckets.values():
+            for action in state.queue:
+                action.future.cancel()
+        self._buckets.clear()
+        self._ready.clear()
+        self._keyed.clear()
+        self._bulk_queued = 0
+        # wake up bulk submitters waiting for space, their actions get cancelled
+        self._bulk_space.set()
+
+    # -vvv- helpers for common actions -vvv-
+    @staticmethod
+    def channel_bucket(channel: discord.abc.Messageable) -> Hashable:
+        # users (DMs) and channels have distinct ids, so they can share a namespace
+        return ("channel", getattr(channel, "id", id(channel)))
+
+    def post(
+        self,
+        channel: discord.abc.Messageable,
+        content: str | None = None,
+        *,
+        priority: Priority = Priority.INTERACTIVE,
+        key: Hashable | None = None,
+        **kwargs,
+    ) -> asyncio.Future:
+        """Queues a message to a channel (or a user, as a DM) without waiting for it.
+        Returns a future resolving to the message, or `None` if a newer message with
+        the same `key` superseded it.
+        """
+        return self.submit(
+            self.channel_bucket(channel),
+            lambda: channel.send(content, **kwargs),
+            priority,
+            key,
+        )
+
+    async def send(
+        self,
+        channel: discord.abc.Messageable,
+        content: str | None = None,
+        *,
+        priority: Priority = Priority.INTERACTIVE,
+        key: Hashable | None = None,
+        **kwargs,
+    ) -> discord.Message | None:
+        """Like `post`, but waits for the message to be sent (and for space in the
+        queue first, for bulk messages).
+        """
+        return await self.run(
+            self.channel_bucket(channel),
+            lambda: channel.send(content, **kwargs),
+            priority,
+            key,
+        )
+
+    def add_reaction(
+        self,
+        message: discord.Message,
+        emoji: str,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> asyncio.Future:
+        """Adds a reaction, unless it's removed again before it goes out."""
+        return self.submit(
+            self.channel_bucket(message.channel),
+            lambda: message.add_reaction(emoji),
+            priority,
+            key=("reaction", message.id, emoji),
+        )
+
+    def remove_reaction(
+        self,
+        message: discord.Message,
+        emoji: str,
+        member: discord.abc.Snowflake,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> asyncio.Future:
+        """Removes a reaction. If the reaction's addition is still queued, neither
+        goes out.
+        """
+        return self.submit(
+            self.channel_bucket(message.channel),
+            lambda: message.remove_reaction(emoji, member),
+            priority,
+            key=("reaction", message.id, emoji),
+            undo=True,
+        )
+
+
+_dispatcher: Dispatcher | None = None
+
+
+def get_dispatcher() -> Dispatcher:
+    """Returns the dispatcher shared by every cog."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = Dispatcher()
+    return _dispatcher
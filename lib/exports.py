@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+from typing import Dict, List
+
+import discord
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class GuildExport:
+    """An on-disk, append-only export of a guild's messages.
+
+    Messages are appended to a JSON lines journal (`exports/{guild_id}-export.jsonl`)
+    and a checkpoint file (`exports/{guild_id}-checkpoint.json`) records, per channel,
+    the last exported message ID and timestamp along with the size of the journal at
+    that point. An interrupted export resumes from the checkpoint (anything written
+    to the journal after the last checkpoint is truncated away), and later exports
+    only fetch messages newer than the checkpoint.
+    """
+
+    def __init__(self, guild_id: int, exports_dir: str | None = None) -> None:
+        self.guild_id = guild_id
+        self.exports_dir = exports_dir or f"{os.getcwd()}/exports"
+
+        self.journal_path = f"{self.exports_dir}/{guild_id}-export.jsonl"
+        self.checkpoint_path = f"{self.exports_dir}/{guild_id}-checkpoint.json"
+        self.export_path = f"{self.exports_dir}/{guild_id}-export.json"
+
+        self.channels: Dict[str, dict] = {}
+        self.journal_size = 0
+
+    def load(self):
+        """Loads the checkpoint (if any) and truncates the journal back to the last
+        checkpointed size, discarding messages that were written but never
+        checkpointed.
+        """
+        if not os.path.exists(self.exports_dir):
+            os.makedirs(self.exports_dir)
+
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf_8") as file:
+                checkpoint = json.load(file)
+            self.channels = checkpoint.get("channels", {})
+            self.journal_size = checkpoint.get("journal_size", 0)
+
+        with open(self.journal_path, mode="a+b") as journal:
+            journal.truncate(self.journal_size)
+
+    def save_checkpoint(self):
+        """Atomically writes the current checkpoint next to the export file."""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, mode="w", encoding="utf_8") as file:
+            json.dump(
+                {"journal_size": self.journal_size, "channels": self.channels},
+                file,
+                indent=4,
+            )
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def last_message_id(self, channel_id: int) -> int | None:
+        """Returns the ID of the last exported message in a channel, if any."""
+        checkpoint = self.channels.get(str(channel_id))
+        return checkpoint and checkpoint["last_message_id"]
+
+    def append(self, channel: discord.TextChannel, messages: List[discord.Message]):
+        """Appends a batch of messages (oldest first) from `channel` to the journal
+        and checkpoints the channel at the last message of the batch.
+        """
+        if not messages:
+            return
+
+        lines = []
+        for message in messages:
+            lines.append(
+                json.dumps(
+                    {
+                        "channel_name": channel.name,
+                        "author_name": message.author.name,
+                        "content": message.content,
+                        "created_at": message.created_at.isoformat(),
+                    }
+                )
+            )
+
+        with open(self.journal_path, mode="ab") as journal:
+            journal.write(("\n".join(lines) + "\n").encode("utf_8"))
+            journal.flush()
+            os.fsync(journal.fileno())
+            self.journal_size = journal.tell()
+
+        last_message = messages[-1]
+        self.channels[str(channel.id)] = {
+            "last_message_id": last_message.id,
+            "last_created_at": last_message.created_at.isoformat(),
+        }
+        self.save_checkpoint()
+
+    async def export_channel(
+        self, channel: discord.TextChannel, batch_size: int = 500
+    ) -> int:
+        """Fetches every message newer than the channel's checkpoint (oldest first)
+        and appends them in batches. Returns the number of new messages exported.
+
+        Batches are written (and fsynced) in a thread, so slow disks don't block the
+        event loop.
+        """
+        last_message_id = self.last_message_id(channel.id)
+        after = last_message_id and discord.Object(id=last_message_id)
+
+        count = 0
+        batch: List[discord.Message] = []
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            batch.append(message)
+            if len(batch) >= batch_size:
+                await asyncio.to_thread(self.append, channel, batch)
+                count += len(batch)
+                batch = []
+
+        await asyncio.to_thread(self.append, channel, batch)
+        count += len(batch)
+
+        logger.debug(f"Exported {count} new messages from #{channel.name}")
+        return count
+
+    def write_export(self) -> int:
+        """Writes the full JSON export file from the journal. Returns the total
+        number of exported messages.
+        """
+        with open(self.journal_path, encoding="utf_8") as journal:
+            exported_messages = [json.loads(line) for line in journal if line.strip()]
+
+        with open(
+            file=self.export_path,
+            mode="w",
+            encoding="utf_8",
+            errors="strict",
+        ) as file:
+            json.dump(exported_messages, file, indent=4)
+
+        return len(exported_messages)
@@ -0,0 +1,118 @@
+import importlib
+import importlib.abc
+import importlib.util
+from types import ModuleType
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from discord.ext import commands
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+# extension -> keyword arguments its cog gets constructed with (see `get_options`)
+_options: Dict[str, dict] = {}
+# extensions that are being reloaded
+_reloading: Set[str] = set()
+# extension -> state its unloaded cog left for the cog replacing it
+_handovers: Dict[str, Any] = {}
+# extensions whose handed over state was taken over
+_taken: Set[str] = set()
+
+
+def set_options(name: str, **options):
+    """Sets the keyword arguments the cog of extension `name` gets constructed with,
+    since an extension's `setup` only gets the bot.
+    """
+    _options[name] = options
+
+
+def get_options(name: str) -> dict:
+    return _options.get(name, {})
+
+
+class _ImportedLoader(importlib.abc.Loader):
+    """Loads an already imported module as itself, rather than executing its code
+    again like discord.py's `load_extension` otherwise would.
+    """
+
+    def __init__(self, module: ModuleType, spec) -> None:
+        self.module = module
+        self.spec = spec
+
+    def create_module(self, spec) -> ModuleType:
+        return self.module
+
+    def exec_module(self, module: ModuleType):
+        # only used once, reloads import the module from its source again
+        module.__spec__ = self.spec
+
+
+def import_extension(name: str) -> ModuleType:
+    """Imports extension `name`, so its module (e.g. the cog class, for the intents
+    it declares) can be used before the bot loads it. `load_extension` then loads
+    this same module, instead of executing it a second time.
+    """
+    module = importlib.import_module(name)
+    spec = module.__spec__
+    module.__spec__ = importlib.util.spec_from_loader(
+        name, _ImportedLoader(module, spec), origin=spec.origin
+    )
+    return module
+
+
+def is_reloading(name: str) -> bool:
+    """Whether extension `name` is being reloaded, i.e. whether its cog is being
+    unloaded to be replaced by a new version, rather than for good.
+    """
+    return name in _reloading
+
+
+def hand_over(name: str, state: Any):
+    """Leaves `state` (e.g. running tasks, open connections) for the cog replacing
+    the one of extension `name`. Called from `cog_unload`, if `is_reloading`.
+    """
+    _handovers[name] = state
+
+
+def take_over(name: str) -> Any:
+    """Returns the state the previous cog of extension `name` handed over, or `None`
+    if it didn't, e.g. because the bot just started.
+
+    The state stays available until the reload is over, so if the new cog fails to
+    load, the previous version discord.py puts back can take it over again.
+    """
+    if name not in _handovers:
+        return None
+    _taken.add(name)
+    return _handovers[name]
+
+
+async def reload_extensions(
+    bot: commands.Bot, names: Iterable[str]
+) -> Tuple[List[str], Dict[str, Exception]]:
+    """Reloads extensions one at a time, so their cogs are replaced without
+    restarting the bot. Cogs hand their state over to their replacements (see
+    `hand_over`), so e.g. music keeps playing.
+
+    If an extension fails to load, discord.py puts the previous version back, and
+    that takes the state over instead. Returns the reloaded extensions and the
+    errors of the ones that failed.
+    """
+    reloaded, failed = [], {}
+    for name in names:
+        _reloading.add(name)
+        try:
+            await bot.reload_extension(name)
+        except commands.ExtensionError as e:
+            logger.exception(f"Failed to reload {name}")
+            failed[name] = e
+        else:
+            reloaded.append(name)
+        finally:
+            _reloading.discard(name)
+            if name in _handovers and name not in _taken:
+                logger.warning(f"Nothing took over the state of {name}")
+            _handovers.pop(name, None)
+            _taken.discard(name)
+    return reloaded, failed
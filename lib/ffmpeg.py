@@ -0,0 +1,222 @@
+import asyncio
+import os
+import subprocess
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import discord
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+# input flags for network streams: reconnect on dropped connections instead of
+# ending the track early, and probe as little as possible before starting to decode
+STREAM_BEFORE_OPTIONS = (
+    "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 "
+    "-probesize 32k -analyzeduration 0"
+)
+# output flags: decoding a single audio stream to PCM doesn't benefit from more than
+# one thread, and ffmpeg would otherwise spin up one per core
+OPTIONS = "-vn -threads 1"
+
+
+class GovernedFFmpegPCMAudio(discord.FFmpegPCMAudio):
+    """A `discord.FFmpegPCMAudio` that holds one of its `FFmpegGovernor`'s slots
+    until it's cleaned up.
+    """
+
+    def __init__(self, source: str, *, governor: "FFmpegGovernor", **kwargs) -> None:
+        self._governor = governor
+        self._released = False
+        self.process: subprocess.Popen | None = None
+        self.created_at = time.monotonic()
+        # `None` until the source starts playing
+        self.last_read_at: float | None = None
+
+        try:
+            super().__init__(source, **kwargs)
+        except Exception:
+            self._release()
+            raise
+
+        self.process = self._process
+        governor._register(self)
+
+    def read(self) -> bytes:
+        self.last_read_at = time.monotonic()
+        return super().read()
+
+    def cleanup(self):
+        super().cleanup()
+        self._release()
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._governor._release(self)
+
+
+class FFmpegGovernor:
+    """Caps how many ffmpeg transcoders run at once, so a node has a predictable
+    capacity, and keeps track of the ones that are running.
+
+    Sources are created with `create`, which waits for a free slot. A slot is freed
+    when its source is cleaned up (discord.py does this when playback ends). The
+    reaper periodically cleans up orphaned sources that were never played within
+    `idle_timeout` seconds of being created, reaps exited processes and logs the
+    CPU and memory usage of every running ffmpeg process. Sources that started
+    playing are left alone otherwise, since a paused track isn't read from either.
+    """
+
+    def __init__(
+        self,
+        max_processes: int | None = None,
+        idle_timeout: float = 15 * 60,
+        reap_interval: float = 60,
+    ) -> None:
+        self.max_processes = max_processes or int(
+            os.environ.get("AMARBOT_MAX_FFMPEG", (os.cpu_count() or 1) * 4)
+        )
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+
+        self._semaphore = asyncio.Semaphore(self.max_processes)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._sources: "weakref.WeakSet[GovernedFFmpegPCMAudio]" = weakref.WeakSet()
+        self._cpu_times: Dict[int, tuple] = {}
+        self._reaper_task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> int:
+        return len(self._sources)
+
+    async def create(
+        self,
+        source: str,
+        *,
+        stream: bool = False,
+        before_options: str | None = None,
+        options: str | None = None,
+    ) -> GovernedFFmpegPCMAudio:
+        """Waits for a free slot and spawns an ffmpeg process for `source`."""
+        self._loop = asyncio.get_running_loop()
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = self._loop.create_task(self._reap_loop())
+
+        if self._semaphore.locked():
+            logger.warning(
+                f"All {self.max_processes} ffmpeg slots are in use, waiting for one..."
+            )
+        await self._semaphore.acquire()
+
+        all_before_options = " ".join(
+            filter(None, [stream and STREAM_BEFORE_OPTIONS, before_options])
+        )
+        return GovernedFFmpegPCMAudio(
+            source,
+            governor=self,
+            before_options=all_before_options or None,
+            options=" ".join(filter(None, [OPTIONS, options])),
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot while running an ffmpeg process that isn't a source, e.g. a
+        loudness analysis.
+        """
+        self._loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def _register(self, source: GovernedFFmpegPCMAudio):
+        self._sources.add(source)
+
+    def _release(self, source: GovernedFFmpegPCMAudio):
+        self._sources.discard(source)
+        if source.process is not None:
+            self._cpu_times.pop(source.process.pid, None)
+
+        # sources get cleaned up from discord.py's audio player thread
+        try:
+            self._loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            # event loop is already closed, nothing left to govern
+            pass
+
+    # -vvv- reaping & stats -vvv-
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                self.reap()
+                for stats in self.stats():
+                    logger.debug(
+                        f"ffmpeg [{stats['pid']}]: cpu={stats['cpu_percent']:.1f}% "
+                        f"rss={stats['rss_bytes'] / 1024 / 1024:.1f}MiB "
+                        f"age={stats['age']:.0f}s"
+                    )
+            except Exception:
+                logger.exception("Failed to reap ffmpeg processes")
+
+    def reap(self):
+        """Cleans up sources whose process exited or that were never played."""
+        now = time.monotonic()
+        for source in list(self._sources):
+            idle_for = now - (source.last_read_at or source.created_at)
+            # an exited process can still have audio left in its stdout pipe, so
+            # give whoever is reading it a moment to finish
+            exited = source.process.poll() is not None and idle_for > 10
+            idle = source.last_read_at is None and idle_for > self.idle_timeout
+            if exited or idle:
+                logger.info(
+                    f"Reaping {'exited' if exited else 'idle'} ffmpeg process "
+                    f"{source.process.pid}"
+                )
+                source.cleanup()
+
+    def stats(self) -> List[dict]:
+        """CPU usage (since the last call) and resident memory of every running
+        ffmpeg process. Only available on Linux (reads `/proc`).
+        """
+        stats = []
+        now = time.monotonic()
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+
+        for source in list(self._sources):
+            pid = source.process.pid
+            try:
+                with open(f"/proc/{pid}/stat") as file:
+                    # skip past the command name, which can contain spaces
+                    fields = file.read().rpartition(")")[2].split()
+                with open(f"/proc/{pid}/statm") as file:
+                    rss_pages = int(file.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+
+            cpu_time = (int(fields[11]) + int(fields[12])) / ticks
+            last_cpu_time, last_time = self._cpu_times.get(
+                pid, (0.0, source.created_at)
+            )
+            self._cpu_times[pid] = (cpu_time, now)
+
+            stats.append(
+                {
+                    "pid": pid,
+                    "cpu_percent": (
+                        100 * (cpu_time - last_cpu_time) / max(now - last_time, 1e-6)
+                    ),
+                    "rss_bytes": rss_pages * page_size,
+                    "age": now - source.created_at,
+                }
+            )
+        return stats
+
+
+governor = FFmpegGovernor()
@@ -1,12 +1,15 @@
 import os
-
-import firebase_admin
-from firebase_admin import firestore_async, storage
-from google.auth.exceptions import DefaultCredentialsError
-from google.cloud.firestore import AsyncClient
+from typing import TYPE_CHECKING
 
 from lib.logging import get_logger
 
+# firebase-admin (and gRPC under it) is slow to import, so it's only imported on
+# first use (see `lib.startup.preload`)
+if TYPE_CHECKING:
+    import firebase_admin
+    from firebase_admin import storage
+    from google.cloud.firestore import AsyncClient
+
 logger = get_logger(__name__)
 
 
@@ -19,20 +22,27 @@ def _setup_adc():
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = creds_path
 
 
-def _init_app() -> firebase_admin.App:
+def _init_app() -> "firebase_admin.App":
+    import firebase_admin
+
     _setup_adc()
     options = {"storageBucket": os.environ.get("FIREBASE_BUCKET_URL")}
     return firebase_admin.initialize_app(name="amarbot-app", options=options)
 
 
-def get_app() -> firebase_admin.App:
+def get_app() -> "firebase_admin.App":
+    import firebase_admin
+
     try:
         return firebase_admin.get_app("amarbot-app")
     except ValueError:
         return _init_app()
 
 
-def get_firestore(app: firebase_admin.App = None) -> AsyncClient:
+def get_firestore(app: "firebase_admin.App" = None) -> "AsyncClient":
+    from firebase_admin import firestore_async
+    from google.auth.exceptions import DefaultCredentialsError
+
     try:
         return firestore_async.client(app or get_app())
     except DefaultCredentialsError:
@@ -44,5 +54,9 @@ def get_firestore(app: firebase_admin.App = None) -> AsyncClient:
         return None
 
 
-def get_storage_bucket(app: firebase_admin.App = None) -> storage.storage.Bucket:
+def get_storage_bucket(
+    app: "firebase_admin.App" = None,
+) -> "storage.storage.Bucket":
+    from firebase_admin import storage
+
     return storage.bucket(app=app or get_app())
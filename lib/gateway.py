@@ -0,0 +1,57 @@
+from typing import Any, Dict, Iterable, Type
+
+import discord
+from discord.ext import commands
+
+# every cog relies on the guild, channel and role cache the guilds intent fills
+BASE_INTENTS = ("guilds",)
+# needed to receive prefix commands (e.g. `!play`), in guilds and in DMs (e.g. `!help`)
+PREFIX_COMMAND_INTENTS = ("guild_messages", "dm_messages", "message_content")
+
+
+def gateway_options(cogs: Iterable[Type[commands.Cog]]) -> Dict[str, Any]:
+    """Works out the intents, message cache size and member cache flags the bot
+    needs, given the classes of its enabled cogs. Returns them as keyword arguments
+    for `commands.Bot`.
+
+    Cogs declare what they need with the class attributes `gateway_intents` and
+    `member_cache_flags` (names of `discord.Intents` and `discord.MemberCacheFlags`
+    flags) and `max_messages` (how many messages they need cached, e.g. for edit
+    events). Cogs with prefix commands also get `PREFIX_COMMAND_INTENTS`. Anything
+    no enabled cog asks for stays off, so it isn't sent by Discord or cached.
+    """
+    intents = discord.Intents.none()
+    member_cache_flags = discord.MemberCacheFlags.none()
+    max_messages = 0
+
+    for name in BASE_INTENTS:
+        setattr(intents, name, True)
+
+    for cog in cogs:
+        names = getattr(cog, "gateway_intents", ())
+        if cog.__cog_commands__:
+            names = (*names, *PREFIX_COMMAND_INTENTS)
+        for name in names:
+            setattr(intents, name, True)
+        for name in getattr(cog, "member_cache_flags", ()):
+            setattr(member_cache_flags, name, True)
+        max_messages = max(max_messages, getattr(cog, "max_messages", 0))
+
+    return {
+        "intents": intents,
+        # None disables the message cache entirely
+        "max_messages": max_messages or None,
+        "member_cache_flags": member_cache_flags,
+        "chunk_guilds_at_startup": intents.members,
+    }
+
+
+def describe(options: Dict[str, Any]) -> str:
+    """Summarizes `gateway_options`' result, for logging."""
+    intents = [name for name, enabled in options["intents"] if enabled]
+    member_cache = [name for name, enabled in options["member_cache_flags"] if enabled]
+    return (
+        f"intents: {', '.join(intents)}; "
+        f"message cache: {options['max_messages'] or 0}; "
+        f"member cache: {', '.join(member_cache) or 'none'}"
+    )
@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+from collections import Counter, deque
+from datetime import datetime, timezone
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Deque, Dict, List
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobPriority(IntEnum):
+    """Priority lanes for background jobs, lower values are started first."""
+
+    # someone is waiting on the result, e.g. a deferred count command
+    INTERACTIVE = 0
+    NORMAL = 1
+    # long history scans nobody is waiting on, e.g. exports and catch ups
+    BULK = 2
+
+
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Job:
+    """A unit of background work. Use `JobQueue.submit` to create these."""
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        guild_id: int,
+        user_id: int,
+        priority: JobPriority,
+        func: Callable[[], Coroutine[Any, Any, Any]],
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.priority = priority
+        self.func = func
+
+        self.status = JobStatus.PENDING
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+
+        self._task: asyncio.Task | None = None
+        self._done: asyncio.Future = asyncio.get_running_loop().create_future()
+        # nobody is required to wait on a job, don't warn about unretrieved errors
+        self._done.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    @property
+    def is_finished(self):
+        return self._done.done()
+
+    async def wait(self):
+        """Waits for the job to finish and returns its result (or raises its error,
+        `asyncio.CancelledError` if it was cancelled).
+        """
+        return await asyncio.shield(self._done)
+
+    def __str__(self) -> str:
+        return f"#{self.id} {self.name} ({self.status})"
+
+
+class JobQueue:
+    """Admission control for heavy background work, like full history scans.
+
+    At most `max_workers` jobs run at once across the whole bot, at most
+    `per_guild` of each priority lane for any single guild, and jobs in each lane
+    are additionally capped by `lane_limits`. By default the bulk lane can never
+    take the last worker, and a guild's bulk scan never holds up its interactive
+    jobs, so those are never stuck behind bulk scans. Pending jobs are started in
+    priority order, then in the order they were submitted.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        per_guild: int = 1,
+        lane_limits: Dict[JobPriority, int] | None = None,
+        history_size: int = 50,
+    ) -> None:
+        self.max_workers = max_workers
+        self.per_guild = per_guild
+        self.lane_limits = lane_limits or {JobPriority.BULK: max(max_workers - 1, 1)}
+
+        self.jobs: Dict[int, Job] = {}
+        self._pending: List[Job] = []
+        # (guild, lane) -> running jobs
+        self._running_guilds: Counter = Counter()
+        self._running_lanes: Counter = Counter()
+        self._finished: Deque[Job] = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+
+    @property
+    def running(self) -> int:
+        return sum(self._running_lanes.values())
+
+    def submit(
+        self,
+        name: str,
+        guild_id: int,
+        user_id: int,
+        func: Callable[[], Coroutine[Any, Any, Any]],
+        priority: JobPriority = JobPriority.NORMAL,
+    ) -> Job:
+        """Queues `func` (a coroutine function taking no arguments) to be run as a
+        job, starting it right away if there is capacity for it.
+        """
+        job = Job(next(self._ids), name, guild_id, user_id, priority, func)
+        self.jobs[job.id] = job
+        self._pending.append(job)
+        self._pending.sort(key=lambda j: (j.priority, j.id))
+
+        logger.debug(f"Queued job {job} for guild {guild_id}")
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id: int) -> Job | None:
+        """Cancels a pending or running job. Returns the job, or `None` if there is
+        no unfinished job with that ID.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return None
+
+        if job.status == JobStatus.PENDING:
+            self._pending.remove(job)
+            self._finish(job, JobStatus.CANCELLED)
+            job._done.cancel()
+        else:
+            job._task.cancel()
+        return job
+
+    def get_jobs(self, guild_id: int) -> List[Job]:
+        """Returns the unfinished and recently finished jobs of a guild."""
+        return [job for job in self.jobs.values() if job.guild_id == guild_id]
+
+    def shutdown(self):
+        """Cancels every pending and running job."""
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def _can_start(self, job: Job) -> bool:
+        if self.running >= self.max_workers:
+            return False
+        if self._running_guilds[job.guild_id, job.priority] >= self.per_guild:
+            return False
+        lane_limit = self.lane_limits.get(job.priority, self.max_workers)
+        return self._running_lanes[job.priority] < lane_limit
+
+    def _dispatch(self):
+        for job in list(self._pending):
+            if self.running >= self.max_workers:
+                break
+            if not self._can_start(job):
+                continue
+
+            self._pending.remove(job)
+            self._running_guilds[job.guild_id, job.priority] += 1
+            self._running_lanes[job.priority] += 1
+
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now(timezone.utc)
+            job._task = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: Job):
+        logger.debug(f"Starting job {job}")
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            self._finish(job, JobStatus.CANCELLED)
+            job._done.cancel()
+        except Exception as e:
+            logger.exception(f"Job {job} failed!")
+            self._finish(job, JobStatus.FAILED)
+            job._done.set_exception(e)
+        else:
+            self._finish(job, JobStatus.DONE)
+            job._done.set_result(result)
+        finally:
+            self._running_guilds[job.guild_id, job.priority] -= 1
+            self._running_lanes[job.priority] -= 1
+            self._dispatch()
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = datetime.now(timezone.utc)
+        logger.debug(f"Finished job {job}")
+
+        # only keep a bounded history of finished jobs around
+        if len(self._finished) == self._finished.maxlen:
+            self.jobs.pop(self._finished[0].id, None)
+        self._finished.append(job)
@@ -1,6 +1,11 @@
+import atexit
+import json
 import logging
-
-from discord.utils import setup_logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Set
 
 
 class ColoredLogsFormatter(logging.Formatter):
@@ -32,22 +37,156 @@ class ColoredLogsFormatter(logging.Formatter):
         return log_formatter.format(record)
 
 
-def get_logger(name: str, log_level: int = logging.DEBUG):
-    logger = logging.getLogger(name)
-    logger.setLevel(log_level)
+class JsonLogsFormatter(logging.Formatter):
+    """Formats records as single line JSON objects, for log collectors."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.processName,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """A `QueueHandler` that leaves all of the work to the `QueueListener`'s thread.
+
+    Records aren't formatted before being queued (the queue is in-process, so they
+    don't need to be picklable), and once the queue is full, records get dropped
+    instead of blocking whoever's logging, e.g. the event loop.
+    """
+
+    def __init__(self, queue: queue.Queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            "name": __name__,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": f"Dropped {self.dropped} log records, queue full",
+                        }
+                    )
+                )
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# -vvv- configuration -vvv-
+# the level of the bot's own loggers (`get_logger`), discord.py's logger and the
+# output format ("text" or "json"), all overridable from the environment
+default_log_level = "INFO"
+default_discord_log_level = "INFO"
+default_log_format = "text"
+# records waiting to be written, beyond this many new records get dropped
+max_queued_records = 10000
+
+_listener: QueueListener | None = None
+_output_handler: logging.Handler | None = None
+# loggers using the configured level, so it can be changed after they're created
+_configured_loggers: Set[str] = set()
+
+
+# environment variables with an invalid level, already warned about
+_invalid_levels: Set[str] = set()
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(ColoredLogsFormatter())
 
-    logger.addHandler(stream_handler)
+def _env_level(name: str, default: str) -> int:
+    """The level named (e.g. `DEBUG`) or numbered in environment variable `name`,
+    or `default` (with a warning) if it isn't a valid level.
+    """
+    level = os.environ.get(name, default).upper()
+    if level.isdigit():
+        return int(level)
+    number = logging.getLevelName(level)
+    if isinstance(number, int):
+        return number
+
+    if name not in _invalid_levels:
+        _invalid_levels.add(name)
+        logging.getLogger(__name__).warning(
+            f"Invalid log level {level!r} in {name}, using {default} instead"
+        )
+    return logging.getLevelName(default)
+
+
+def _install_handlers():
+    """Routes every log record through a queue to a single output handler on a
+    background thread, so formatting and writing never happen on the event loop.
+    """
+    global _listener, _output_handler
+    if _listener is not None:
+        return
+
+    records = queue.Queue(max_queued_records)
+    _output_handler = logging.StreamHandler()
+    _listener = QueueListener(records, _output_handler, respect_handler_level=True)
+    _listener.start()
+    # flush whatever's left in the queue on exit
+    atexit.register(_listener.stop)
+
+    logging.getLogger().addHandler(NonBlockingQueueHandler(records))
+    setup_logging()
+
+
+def setup_logging():
+    """(Re)applies the logging configuration from the environment
+    (`AMARBOT_LOG_LEVEL`, `AMARBOT_DISCORD_LOG_LEVEL` and `AMARBOT_LOG_FORMAT`).
+
+    Called automatically on the first `get_logger`, call it again after loading a
+    `.env` file to pick up its settings.
+    """
+    if _listener is None:
+        _install_handlers()
+        return
+
+    log_format = os.environ.get("AMARBOT_LOG_FORMAT", default_log_format).lower()
+    _output_handler.setFormatter(
+        JsonLogsFormatter() if log_format == "json" else ColoredLogsFormatter()
+    )
+
+    log_level = _env_level("AMARBOT_LOG_LEVEL", default_log_level)
+    for name in _configured_loggers:
+        logging.getLogger(name).setLevel(log_level)
+
+
+def get_logger(name: str, log_level: int | None = None):
+    """Returns the logger for `name`, at the configured level unless `log_level` is
+    given. Output goes through the shared (non-blocking) handler, so calling this
+    any number of times for the same name never duplicates log lines.
+    """
+    _install_handlers()
+
+    logger = logging.getLogger(name)
+    if log_level is None:
+        _configured_loggers.add(name)
+        logger.setLevel(_env_level("AMARBOT_LOG_LEVEL", default_log_level))
+    else:
+        _configured_loggers.discard(name)
+        logger.setLevel(log_level)
 
     return logger
 
 
 def setup_discord_logging():
-    setup_logging(
-        handler=logging.StreamHandler(),
-        formatter=ColoredLogsFormatter(),
-        level=logging.INFO,
-        root=False,
+    """Sets discord.py's log level, its records go through the shared handler."""
+    _install_handlers()
+    logging.getLogger("discord").setLevel(
+        _env_level("AMARBOT_DISCORD_LOG_LEVEL", default_discord_log_level)
     )
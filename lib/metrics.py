@@ -0,0 +1,364 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from aiohttp import web
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+# default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """A metric family, with one child per combination of label values. Children
+    are created on first use and reused from then on, so recording a value is a
+    dict lookup and an in-place update.
+
+    Metrics are only ever updated from the event loop thread, so there are no locks.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.label_names:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        self._children.pop(values, None)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self._samples())
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+    def _samples(self):
+        return [
+            f"{self.name}_total{_format_labels(self.label_names, values)} {child.value}"
+            for values, child in self._children.items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(Metric):
+    """A value that goes up and down. Instead of being set, it can also be computed
+    when scraped with `set_function`, returning either a value or (for labeled
+    gauges) a dict of label value tuples to values.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._function: Callable[[], float | Dict[Tuple[str, ...], float]] | None = None
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def set_function(self, function: Callable | None):
+        self._function = function
+
+    def _samples(self):
+        values = {values: child.value for values, child in self._children.items()}
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception:
+                logger.exception(f"Failed to compute {self.name}")
+                result = {}
+            values = result if isinstance(result, dict) else {(): result}
+
+        return [
+            f"{self.name}{_format_labels(self.label_names, label_values)} {value}"
+            for label_values, value in values.items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # one count per bucket (not cumulative, that's done when rendering) plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """Context manager observing how long its body took (works around awaits)."""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild) -> None:
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+    def _samples(self):
+        samples = []
+        for values, child in self._children.items():
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(self.label_names + ("le",), values + (bound,))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            samples.append(f"{self.name}_sum{labels} {child.sum}")
+            samples.append(f"{self.name}_count{labels} {child.count}")
+        return samples
+
+
+class MetricsRegistry:
+    """Holds every metric, renders them in the Prometheus text format and serves
+    them on a local `/metrics` endpoint.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self._runner: web.AppRunner | None = None
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+    async def _handle_metrics(self, request: web.Request):
+        return web.Response(
+            text=self.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start_server(self, host: str = "127.0.0.1", port: int = 9464):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop_server(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class RateLimitCounter(logging.Filter):
+    """Counts discord.py's REST rate limit hits, which it only reports by logging.
+
+    Every 429 is logged as "We are being rate limited", and global ones are then
+    also logged as "Global rate limit has been hit" (right after, without awaiting
+    in between). Counting a route hit is deferred by a loop iteration, so a global
+    hit is counted once, as global.
+    """
+
+    def __init__(self, counter: Counter) -> None:
+        super().__init__()
+        self.counter = counter
+        self._pending_route_hit: asyncio.Handle | None = None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not isinstance(record.msg, str):
+            return True
+
+        if record.msg.startswith("We are being rate limited"):
+            count = self.counter.labels("route").inc
+            try:
+                self._pending_route_hit = asyncio.get_running_loop().call_soon(count)
+            except RuntimeError:
+                count()
+        elif record.msg.startswith("Global rate limit has been hit"):
+            if self._pending_route_hit is not None:
+                self._pending_route_hit.cancel()
+                self._pending_route_hit = None
+            self.counter.labels("global").inc()
+        return True
+
+
+async def measure_loop_lag(interval: float = 0.5):
+    """Measures how late the event loop wakes up from a sleep, forever."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start - interval
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+registry = MetricsRegistry()
+
+# -vvv- metrics -vvv-
+COMMAND_LATENCY = registry.histogram(
+    "amarbot_command_duration_seconds",
+    "Time taken to run a command.",
+    labels=("command", "kind", "status"),
+)
+LOOP_LAG = registry.histogram(
+    "amarbot_event_loop_lag_seconds",
+    "How late the event loop ran a timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+LOOP_LAG_LAST = registry.gauge(
+    "amarbot_event_loop_lag_last_seconds", "Most recently measured event loop lag."
+)
+MUSIC_QUEUE_DEPTH = registry.gauge(
+    "amarbot_music_queue_depth", "Songs in a guild's music queue.", labels=("guild",)
+)
+MUSIC_EXTRACTION = registry.histogram(
+    "amarbot_music_extraction_seconds",
+    "Time taken to extract a track's stream with youtube_dl.",
+    labels=("guild",),
+)
+REMINDERS_PENDING = registry.gauge(
+    "amarbot_reminders_pending", "Reminders scheduled to be sent."
+)
+REMINDER_DRIFT = registry.histogram(
+    "amarbot_reminder_drift_seconds",
+    "How late reminders were sent, compared to when they were due.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+RATE_LIMITS = registry.counter(
+    "amarbot_rest_rate_limits",
+    "Discord REST responses that were rate limited (429).",
+    labels=("scope",),
+)
+FIRESTORE_LATENCY = registry.histogram(
+    "amarbot_firestore_call_seconds",
+    "Time taken by Firestore calls.",
+    labels=("operation",),
+)
+ACK_CALLS = registry.counter(
+    "amarbot_ack_reaction_calls", "REST calls made for command acknowledgements."
+)
+ACK_CALLS_SAVED = registry.counter(
+    "amarbot_ack_reaction_calls_saved",
+    "REST calls saved by not acknowledging fast commands.",
+)
+DISPATCHED = registry.counter(
+    "amarbot_dispatched_actions",
+    "Outbound REST actions run by the dispatcher.",
+    labels=("priority",),
+)
+DISPATCH_COALESCED = registry.counter(
+    "amarbot_dispatch_coalesced_actions",
+    "Outbound REST actions dropped because a newer action superseded them.",
+    labels=("priority",),
+)
+DISPATCH_QUEUED = registry.gauge(
+    "amarbot_dispatch_queued_actions", "Outbound REST actions waiting to run."
+)
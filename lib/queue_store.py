@@ -0,0 +1,138 @@
+import json
+import os
+from typing import IO, Dict, List
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class QueueState:
+    """The persisted state of a guild's music queue."""
+
+    def __init__(self) -> None:
+        self.queue: List[str] = []
+        self.position = 0.0
+        self.voice_channel_id: int | None = None
+        self.text_channel_id: int | None = None
+
+    def apply(self, entry: dict):
+        """Applies a single log entry to the state."""
+        op = entry["op"]
+        if op == "snapshot":
+            self.queue = entry["queue"]
+            self.position = entry["position"]
+            self.voice_channel_id = entry["voice_channel_id"]
+            self.text_channel_id = entry["text_channel_id"]
+        elif op == "push":
+            self.queue.append(entry["url"])
+        elif op == "insert":
+            self.queue.insert(entry["index"], entry["url"])
+        elif op == "set":
+            self.queue[entry["index"]] = entry["url"]
+        elif op == "pop":
+            self.queue.pop(entry["index"])
+            if entry["index"] == 0:
+                self.position = 0.0
+        elif op == "position":
+            self.position = entry["position"]
+        elif op == "channels":
+            self.voice_channel_id = entry["voice_channel_id"]
+            self.text_channel_id = entry["text_channel_id"]
+
+    def to_snapshot(self) -> dict:
+        return {
+            "op": "snapshot",
+            "queue": self.queue,
+            "position": self.position,
+            "voice_channel_id": self.voice_channel_id,
+            "text_channel_id": self.text_channel_id,
+        }
+
+
+class QueueStore:
+    """Persists each guild's music queue and playback position to an append-only log
+    (`data/music/{guild_id}.log`, one JSON entry per line).
+
+    Every change is a single appended line, and once a log grows past
+    `compact_after` entries it's compacted down to a single snapshot entry. Restoring
+    a guild's queue is one sequential read of its log.
+    """
+
+    def __init__(self, data_dir: str | None = None, compact_after: int = 500) -> None:
+        self.data_dir = data_dir or f"{os.getcwd()}/data/music"
+        self.compact_after = compact_after
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        self._states: Dict[int, QueueState] = {}
+        self._files: Dict[int, IO[str]] = {}
+        self._entries: Dict[int, int] = {}
+
+    def _path(self, guild_id: int):
+        return f"{self.data_dir}/{guild_id}.log"
+
+    def guild_ids(self) -> List[int]:
+        """IDs of every guild with a persisted queue."""
+        return [
+            int(filename.removesuffix(".log"))
+            for filename in os.listdir(self.data_dir)
+            if filename.endswith(".log")
+        ]
+
+    def load(self, guild_id: int) -> QueueState:
+        """Replays a guild's log into its current state."""
+        state = self._states.get(guild_id)
+        if state is not None:
+            return state
+
+        state = QueueState()
+        entries = 0
+        if os.path.exists(self._path(guild_id)):
+            with open(self._path(guild_id), encoding="utf_8") as file:
+                for line in file:
+                    try:
+                        state.apply(json.loads(line))
+                    except (ValueError, KeyError, IndexError):
+                        # most likely a partially written last line, ignore it
+                        logger.warning(f"Skipping bad queue log entry for {guild_id}")
+                    entries += 1
+
+        self._states[guild_id] = state
+        self._entries[guild_id] = entries
+        return state
+
+    def append(self, guild_id: int, entry: dict):
+        """Applies and appends an entry to a guild's log."""
+        state = self.load(guild_id)
+        state.apply(entry)
+
+        file = self._files.get(guild_id)
+        if file is None:
+            file = open(self._path(guild_id), mode="a", encoding="utf_8")
+            self._files[guild_id] = file
+        file.write(json.dumps(entry) + "\n")
+        file.flush()
+
+        self._entries[guild_id] += 1
+        if self._entries[guild_id] > self.compact_after:
+            self.compact(guild_id)
+
+    def compact(self, guild_id: int):
+        """Rewrites a guild's log as a single snapshot of its current state."""
+        state = self.load(guild_id)
+
+        file = self._files.pop(guild_id, None)
+        if file is not None:
+            file.close()
+
+        path = self._path(guild_id)
+        with open(f"{path}.tmp", mode="w", encoding="utf_8") as tmp_file:
+            tmp_file.write(json.dumps(state.to_snapshot()) + "\n")
+        os.replace(f"{path}.tmp", path)
+        self._entries[guild_id] = 1
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, List
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+# the modes the bot can run in, see `amarbot.py`
+PRODUCTION = "production"
+DIAGNOSTICS = "diagnostics"
+MODES = (PRODUCTION, DIAGNOSTICS)
+
+
+def install_uvloop() -> bool:
+    """Makes asyncio use uvloop's (faster) event loop, if uvloop is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop isn't installed, using the default event loop")
+        return False
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info(f"Using uvloop {uvloop.__version__}")
+    return True
+
+
+class SlowCallbackMonitor(logging.Filter):
+    """Collects asyncio's slow callback warnings (only emitted in debug mode) and
+    periodically logs a report of the worst offenders, instead of one warning per
+    slow callback.
+
+    Callbacks are grouped by coroutine (for tasks) or function name, and ranked by
+    the total time they blocked the event loop for.
+    """
+
+    # pulls the coroutine or function name out of asyncio's handle descriptions,
+    # e.g. "<Task pending name='Task-2' coro=<foo() running at ...>" or
+    # "<Handle MusicController._finish_song(None) at ...>"
+    name_pattern = re.compile(r"coro=<([^\s(]+)|Handle ([^\s(]+)")
+
+    def __init__(
+        self, threshold: float = 0.1, report_interval: float = 60, top: int = 10
+    ) -> None:
+        super().__init__()
+        self.threshold = threshold
+        self.report_interval = report_interval
+        self.top = top
+
+        # name -> [count, total seconds, worst seconds]
+        self.stats: Dict[str, List[float]] = {}
+        self._reported_at = time.monotonic()
+        self._report_task: asyncio.Task | None = None
+
+    def start(self):
+        """Starts monitoring the running event loop (which must be in debug mode)."""
+        loop = asyncio.get_running_loop()
+        if not loop.get_debug():
+            logger.warning("Slow callbacks are only detected in asyncio debug mode")
+        loop.slow_callback_duration = self.threshold
+
+        logging.getLogger("asyncio").addFilter(self)
+        self._report_task = loop.create_task(self._report_loop())
+
+    def stop(self):
+        logging.getLogger("asyncio").removeFilter(self)
+        if self._report_task:
+            self._report_task.cancel()
+        self.report()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (
+            not isinstance(record.msg, str)
+            or not record.msg.startswith("Executing %s took")
+            or len(record.args) != 2
+        ):
+            return True
+
+        description, duration = record.args
+        match = self.name_pattern.search(description)
+        name = match and (match[1] or match[2]) or description[:100]
+
+        stats = self.stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+        # swallow the individual warning, it's part of the next report
+        return False
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self):
+        """Logs the worst offending callbacks since the last report."""
+        if not self.stats:
+            self._reported_at = time.monotonic()
+            return
+
+        ranked = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [
+            f"{name}: {int(count)}x, {total * 1000:.0f}ms total, "
+            f"{worst * 1000:.0f}ms worst"
+            for name, (count, total, worst) in ranked[: self.top]
+        ]
+        logger.warning(
+            f"Slow callbacks (over {self.threshold * 1000:.0f}ms) in the last "
+            f"{time.monotonic() - self._reported_at:.0f}s:\n" + "\n".join(lines)
+        )
+        self.stats = {}
+        self._reported_at = time.monotonic()
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Set
+
+import discord
+from discord.utils import time_snowflake
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class SearchResult:
+    def __init__(
+        self,
+        guild_id: int,
+        message_id: int,
+        channel_id: int,
+        author_name: str,
+        created_at: datetime,
+        snippet: str,
+    ) -> None:
+        self.guild_id = guild_id
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.author_name = author_name
+        self.created_at = created_at
+        self.snippet = snippet
+
+    @property
+    def jump_url(self):
+        return (
+            f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/"
+            f"{self.message_id}"
+        )
+
+
+class MessageSearchIndex:
+    """Local full-text search index over guild messages, backed by SQLite FTS5.
+
+    Each guild gets its own database (`data/search/{guild_id}.sqlite3`). Messages are
+    keyed by their snowflake ID (the FTS rowid), which makes date filters simple
+    rowid range checks. Channels are filled by `backfill` (resumable, it records the
+    last indexed message ID per channel) and kept current by the live message
+    events of guilds that have an index. Messages sent while the bot was offline are
+    picked up by `catch_up`.
+
+    All database access happens on a single worker thread, so SQLite work never
+    blocks the event loop.
+    """
+
+    def __init__(self, data_dir: str | None = None) -> None:
+        self.data_dir = data_dir or f"{os.getcwd()}/data/search"
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        self.guild_ids: Set[int] = {
+            int(filename.removesuffix(".sqlite3"))
+            for filename in os.listdir(self.data_dir)
+            if filename.endswith(".sqlite3")
+        }
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._backfilling: Set[int] = set()
+        # channels backfilled since the bot started, only these can have their
+        # checkpoint moved by live messages without skipping the ones missed offline
+        self._caught_up: Set[int] = set()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connect(self, guild_id: int) -> sqlite3.Connection:
+        conn = self._connections.get(guild_id)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(f"{self.data_dir}/{guild_id}.sqlite3")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+            "content, author_name, channel_id UNINDEXED, author_id UNINDEXED, "
+            "created_at UNINDEXED)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS channels ("
+            "channel_id INTEGER PRIMARY KEY, last_message_id INTEGER NOT NULL)"
+        )
+        conn.commit()
+
+        self._connections[guild_id] = conn
+        self.guild_ids.add(guild_id)
+        return conn
+
+    def close(self):
+        """Closes every database connection and stops the worker thread."""
+
+        def _close():
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+
+        self._executor.submit(_close)
+        self._executor.shutdown(wait=True)
+
+    # -vvv- writes -vvv-
+    @staticmethod
+    def _to_row(message: discord.Message):
+        return (
+            message.id,
+            message.content,
+            message.author.name,
+            message.channel.id,
+            message.author.id,
+            message.created_at.timestamp(),
+        )
+
+    def _write(
+        self,
+        guild_id: int,
+        rows: List[tuple],
+        checkpoint: tuple | None = None,
+    ):
+        conn = self._connect(guild_id)
+        with conn:
+            conn.executemany(
+                "DELETE FROM messages WHERE rowid = ?", [(row[0],) for row in rows]
+            )
+            conn.executemany(
+                "INSERT INTO messages "
+                "(rowid, content, author_name, channel_id, author_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if checkpoint:
+                conn.execute(
+                    "INSERT INTO channels (channel_id, last_message_id) VALUES (?, ?) "
+                    "ON CONFLICT (channel_id) DO UPDATE SET "
+                    "last_message_id = MAX(last_message_id, excluded.last_message_id)",
+                    checkpoint,
+                )
+
+    def _delete(self, guild_id: int, message_ids: Iterable[int]):
+        conn = self._connect(guild_id)
+        with conn:
+            conn.executemany(
+                "DELETE FROM messages WHERE rowid = ?", [(id,) for id in message_ids]
+            )
+
+    def _last_message_id(self, guild_id: int, channel_id: int) -> int:
+        conn = self._connect(guild_id)
+        row = conn.execute(
+            "SELECT last_message_id FROM channels WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _indexed_channel_ids(self, guild_id: int) -> List[int]:
+        conn = self._connect(guild_id)
+        return [row[0] for row in conn.execute("SELECT channel_id FROM channels")]
+
+    async def backfill(self, channel: discord.TextChannel, batch_size: int = 500) -> int:
+        """Indexes every message in `channel` newer than its last indexed message.
+        Returns the number of messages indexed.
+        """
+        guild_id = channel.guild.id
+        self._backfilling.add(channel.id)
+        try:
+            last_message_id = await self._run(self._last_message_id, guild_id, channel.id)
+
+            count = 0
+            rows = []
+            async for message in channel.history(
+                limit=None, after=discord.Object(id=last_message_id), oldest_first=True
+            ):
+                rows.append(self._to_row(message))
+                if len(rows) >= batch_size:
+                    await self._run(self._write, guild_id, rows, (channel.id, rows[-1][0]))
+                    count += len(rows)
+                    rows = []
+
+            await self._run(
+                self._write, guild_id, rows, (channel.id, rows[-1][0] if rows else 0)
+            )
+            count += len(rows)
+            self._caught_up.add(channel.id)
+        finally:
+            self._backfilling.discard(channel.id)
+
+        logger.debug(f"Indexed {count} messages from #{channel.name}")
+        return count
+
+    async def catch_up(self, guild: discord.Guild) -> int:
+        """Backfills every indexed channel of `guild` the bot can still see, picking
+        up the messages sent while it was offline. Returns the number of messages
+        indexed.
+        """
+        if guild.id not in self.guild_ids:
+            return 0
+
+        count = 0
+        for channel_id in await self._run(self._indexed_channel_ids, guild.id):
+            channel = guild.get_channel(channel_id)
+            if channel is None or channel_id in self._caught_up:
+                continue
+            try:
+                count += await self.backfill(channel)
+            except discord.HTTPException:
+                logger.exception(f"Failed to catch up the search index of {channel_id}")
+        return count
+
+    async def on_message(self, message: discord.Message):
+        if message.guild is None or message.guild.id not in self.guild_ids:
+            return
+
+        # advance the channel's checkpoint only once it's been backfilled (since the
+        # bot started), otherwise an interrupted backfill, or the messages sent while
+        # the bot was offline, would be skipped
+        checkpoint = None
+        if (
+            message.channel.id in self._caught_up
+            and message.channel.id not in self._backfilling
+        ):
+            checkpoint = (message.channel.id, message.id)
+
+        await self._run(self._write, message.guild.id, [self._to_row(message)], checkpoint)
+
+    async def on_message_edit(self, message: discord.Message):
+        if message.guild is None or message.guild.id not in self.guild_ids:
+            return
+        await self._run(self._write, message.guild.id, [self._to_row(message)])
+
+    async def on_message_delete(self, guild_id: int | None, message_ids: Iterable[int]):
+        if guild_id not in self.guild_ids:
+            return
+        await self._run(self._delete, guild_id, list(message_ids))
+
+    # -vvv- queries -vvv-
+    def _search(
+        self,
+        guild_id: int,
+        query: str,
+        channel_ids: List[int],
+        author_id: int | None,
+        after: datetime | None,
+        before: datetime | None,
+        limit: int,
+    ) -> List[SearchResult]:
+        conn = self._connect(guild_id)
+
+        sql = (
+            "SELECT rowid, channel_id, author_name, created_at, "
+            "snippet(messages, 0, '**', '**', '…', 16) "
+            "FROM messages WHERE messages MATCH ?"
+        )
+        params: list = [query]
+
+        sql += f" AND channel_id IN ({', '.join('?' * len(channel_ids))})"
+        params.extend(channel_ids)
+        if author_id is not None:
+            sql += " AND author_id = ?"
+            params.append(author_id)
+        if after is not None:
+            sql += " AND rowid >= ?"
+            params.append(time_snowflake(after))
+        if before is not None:
+            sql += " AND rowid < ?"
+            params.append(time_snowflake(before))
+
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            # not a valid FTS query (stray quotes, operators, etc.), search for the
+            # words literally instead
+            params[0] = " ".join(
+                '"' + word.replace('"', '""') + '"' for word in query.split()
+            )
+            rows = conn.execute(sql, params).fetchall()
+
+        return [
+            SearchResult(
+                guild_id,
+                message_id,
+                channel_id,
+                author_name,
+                datetime.fromtimestamp(created_at, timezone.utc),
+                snippet,
+            )
+            for message_id, channel_id, author_name, created_at, snippet in rows
+        ]
+
+    async def search(
+        self,
+        guild_id: int,
+        query: str,
+        channel_ids: List[int],
+        author_id: int | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+        limit: int = 10,
+    ) -> List[SearchResult]:
+        """Runs a ranked (BM25) full-text query over the messages of `channel_ids`,
+        optionally filtered by author and date.
+        """
+        if guild_id not in self.guild_ids or not channel_ids:
+            return []
+        return await self._run(
+            self._search, guild_id, query, channel_ids, author_id, after, before, limit
+        )
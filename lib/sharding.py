@@ -0,0 +1,152 @@
+import asyncio
+import signal
+import sys
+from typing import Dict, List
+
+import aiohttp
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def shard_ranges(shard_count: int, workers: int) -> List[List[int]]:
+    """Splits shards `0..shard_count` into `workers` contiguous ranges, as evenly as
+    possible (never more ranges than shards).
+    """
+    workers = max(min(workers, shard_count), 1)
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """The shard Discord sends a guild's events to."""
+    return (guild_id >> 22) % shard_count
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Asks Discord how many shards the bot should run."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+    return data["shards"]
+
+
+class Supervisor:
+    """Runs the bot as one worker process per range of shards, so guilds are spread
+    over every core instead of sharing a single event loop, and restarts workers
+    that crash.
+
+    Workers are started by running `amarbot.py` again with `args` plus the shards
+    they own (`--worker`, `--shard_ids` and `--shard_count`). They're fresh
+    interpreters rather than forks, so nothing (Firestore clients, youtube_dl
+    instances, the event loop) is shared between them.
+
+    Crashed workers are restarted after `restart_delay` seconds, doubling up to
+    `max_restart_delay` while they keep crashing within `stable_after` seconds of
+    starting.
+    """
+
+    def __init__(
+        self,
+        args: List[str],
+        shard_count: int,
+        workers: int,
+        restart_delay: float = 5,
+        max_restart_delay: float = 300,
+        stable_after: float = 600,
+    ) -> None:
+        self.args = args
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts: Dict[int, int] = dict.fromkeys(range(len(self.ranges)), 0)
+        # set once stopping, wakes up workers waiting to be restarted
+        self._stopping = asyncio.Event()
+
+    def worker_args(self, worker: int) -> List[str]:
+        shard_ids = ",".join(str(shard_id) for shard_id in self.ranges[worker])
+        return [
+            *self.args,
+            "--worker",
+            str(worker),
+            "--shard_ids",
+            shard_ids,
+            "--shard_count",
+            str(self.shard_count),
+        ]
+
+    async def _run_worker(self, worker: int):
+        loop = asyncio.get_running_loop()
+        delay = self.restart_delay
+        while not self._stopping.is_set():
+            started_at = loop.time()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, *self.worker_args(worker)
+            )
+            self.processes[worker] = process
+            if self._stopping.is_set():
+                # stopped while the process was starting, so `stop` missed it
+                process.send_signal(signal.SIGINT)
+            logger.info(
+                f"Started worker {worker} (pid {process.pid}) for shards "
+                f"{self.ranges[worker][0]}-{self.ranges[worker][-1]}"
+            )
+
+            returncode = await process.wait()
+            del self.processes[worker]
+            if self._stopping.is_set():
+                return
+            if returncode == 0:
+                logger.info(f"Worker {worker} exited")
+                return
+
+            if loop.time() - started_at >= self.stable_after:
+                delay = self.restart_delay
+            self.restarts[worker] += 1
+            logger.error(
+                f"Worker {worker} exited with code {returncode}, restarting it in "
+                f"{delay:.0f} seconds"
+            )
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.max_restart_delay)
+
+    async def stop(self):
+        """Stops every worker, giving them a chance to shut down cleanly."""
+        self._stopping.set()
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)
+        await asyncio.gather(*[process.wait() for process in self.processes.values()])
+
+    async def run(self):
+        logger.info(
+            f"Running {self.shard_count} shards in {len(self.ranges)} worker processes"
+        )
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.stop()))
+
+        try:
+            await asyncio.gather(
+                *[self._run_worker(worker) for worker in range(len(self.ranges))]
+            )
+        finally:
+            if not self._stopping.is_set():
+                await self.stop()
@@ -0,0 +1,53 @@
+import asyncio
+import importlib
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict
+
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+async def preload(*modules: str):
+    """Imports slow to import modules in threads, so they're ready by the time
+    they're needed without blocking the event loop.
+    """
+    await asyncio.gather(
+        *[asyncio.to_thread(importlib.import_module, module) for module in modules]
+    )
+
+
+class StartupProfiler:
+    """Records how long each cog took to import and to initialize (construct and
+    load, see `Cog.cog_load`).
+
+    A module's import time includes every dependency imported for the first time,
+    so shared dependencies count towards whichever cog imports them first. Init
+    times are wall time, so they're only each cog's own if cogs are initialized one
+    at a time.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = perf_counter()
+        # name -> phase -> seconds
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def measure(self, name: str, phase: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.setdefault(name, {})[phase] = perf_counter() - start
+
+    def report(self) -> str:
+        lines = [f"{'cog':<12}{'import':>10}{'init':>10}"]
+        for name, phases in self.timings.items():
+            lines.append(
+                f"{name:<12}"
+                f"{phases.get('import', 0) * 1000:>8.0f}ms"
+                f"{phases.get('init', 0) * 1000:>8.0f}ms"
+            )
+        lines.append(f"total: {(perf_counter() - self.started_at) * 1000:.0f}ms")
+        return "\n".join(lines)
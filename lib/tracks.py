@@ -0,0 +1,142 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+from typing import Dict
+
+from lib.ffmpeg import governor
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class TrackCache:
+    """Persistent metadata for tracks that have been played, keyed by video ID
+    (`data/tracks.json`). Holds things that are expensive to work out and don't
+    change, like a track's loudness normalization gain.
+
+    When sharded, every worker process has a cache of its own and saves merge into
+    the shared file, so workers don't overwrite each other's tracks.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path or f"{os.getcwd()}/data/tracks.json"
+        self.tracks: Dict[str, dict] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf_8") as file:
+                self.tracks = json.load(file)
+
+    def get(self, video_id: str) -> dict:
+        return self.tracks.get(video_id, {})
+
+    def update(self, video_id: str, **metadata):
+        self.tracks.setdefault(video_id, {}).update(metadata)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.lock", mode="w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # pick up tracks other processes saved since this cache was loaded
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf_8") as file:
+                    for video_id, metadata in json.load(file).items():
+                        self.tracks[video_id] = {
+                            **metadata,
+                            **self.tracks.get(video_id, {}),
+                        }
+
+            with open(f"{self.path}.tmp", mode="w", encoding="utf_8") as file:
+                json.dump(self.tracks, file)
+            os.replace(f"{self.path}.tmp", self.path)
+
+
+class LoudnessAnalyzer:
+    """Works out per-track gains that bring tracks to a common loudness, using
+    ffmpeg's `loudnorm` filter (EBU R128) in analysis mode.
+
+    Analysis runs in a background ffmpeg process and results are cached by video
+    ID in the `TrackCache`, so each track is only ever analyzed once. The gain is
+    applied by ffmpeg itself at playback time (see `YTDLSource`).
+    """
+
+    # integrated loudness to normalize to, in LUFS
+    target = -16.0
+    # how much audio to analyze, in seconds
+    analysis_duration = 120
+    max_boost = 10.0
+    max_cut = -20.0
+
+    def __init__(self, cache: TrackCache, max_concurrent: int = 1) -> None:
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def gain(self, video_id: str) -> float | None:
+        """Returns the cached gain (in dB) for a track, if it's been analyzed."""
+        return self.cache.get(video_id).get("gain_db")
+
+    def analyze(self, video_id: str, url: str) -> asyncio.Task:
+        """Analyzes a track in the background (once), caching its gain."""
+        task = self._in_flight.get(video_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._analyze(video_id, url))
+            self._in_flight[video_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(video_id, None))
+        return task
+
+    async def _analyze(self, video_id: str, url: str) -> float | None:
+        if self.gain(video_id) is not None:
+            return self.gain(video_id)
+
+        # the analysis is an ffmpeg process like any other, so it takes a slot too
+        async with self._semaphore, governor.slot():
+            process = None
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg",
+                    "-hide_banner",
+                    "-nostats",
+                    "-t",
+                    str(self.analysis_duration),
+                    "-i",
+                    url,
+                    "-vn",
+                    "-af",
+                    f"loudnorm=I={self.target}:print_format=json",
+                    "-f",
+                    "null",
+                    "-",
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await process.communicate()
+            except OSError:
+                logger.exception("Failed to run ffmpeg for loudness analysis")
+                return None
+            finally:
+                # e.g. cancelled, don't leave the process running
+                if process is not None and process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        # loudnorm prints its measurements as the last JSON object on stderr
+        measurements = re.findall(r"\{[^{}]*\}", stderr.decode(errors="ignore"))
+        try:
+            input_loudness = float(json.loads(measurements[-1])["input_i"])
+        except (IndexError, KeyError, ValueError):
+            logger.warning(f"Couldn't analyze loudness of {video_id}")
+            return None
+
+        # silence (or close to it) measures as -inf/-70 LUFS, don't try to boost it
+        if input_loudness <= -70:
+            gain = 0.0
+        else:
+            gain = min(max(self.target - input_loudness, self.max_cut), self.max_boost)
+
+        self.cache.update(video_id, gain_db=round(gain, 2))
+        logger.debug(f"Analyzed {video_id}: {input_loudness} LUFS, gain {gain:.2f}dB")
+        return gain
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import discord
+from discord import app_commands
+
+from lib.dispatch import Priority, get_dispatcher
+from lib.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def tree_hash(
+    tree: app_commands.CommandTree, guild: discord.abc.Snowflake | None = None
+) -> str:
+    """A stable hash of the commands `tree.sync(guild=guild)` would push, i.e. their
+    serialized payloads, in a fixed order.
+    """
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class TreeSyncer:
+    """Syncs the application command tree, skipping scopes (global, or a guild)
+    whose commands haven't changed since they were last synced.
+
+    The hash of every scope's commands is stored after each successful sync
+    (`data/sync_hashes.json`), so redundant syncs don't hit the bulk overwrite
+    endpoint, which has tight rate limits. Changes made outside of the bot (e.g. by
+    another deploy with the same application) can't be seen, so `force` syncs
+    regardless.
+    """
+
+    def __init__(self, tree: app_commands.CommandTree, path: str | None = None):
+        self.tree = tree
+        self.path = path or f"{os.getcwd()}/data/sync_hashes.json"
+        # scope -> hash of its commands when last synced
+        self.hashes: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf_8") as file:
+                self.hashes = json.load(file)
+
+    def _scope(self, guild: discord.abc.Snowflake | None = None) -> str:
+        scope = "global" if guild is None else str(guild.id)
+        # hashes of different applications (e.g. a test bot) don't mix
+        return f"{self.tree.client.application_id}:{scope}"
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", mode="w", encoding="utf_8") as file:
+            json.dump(self.hashes, file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    async def sync(
+        self, guild: discord.abc.Snowflake | None = None, force: bool = False
+    ) -> List[app_commands.AppCommand] | None:
+        """Syncs the tree to `guild` (or globally). Returns the synced commands, or
+        `None` if the sync was skipped because nothing changed.
+        """
+        scope = self._scope(guild)
+        digest = tree_hash(self.tree, guild)
+        if not force and self.hashes.get(scope) == digest:
+            logger.debug(f"Commands of {scope} didn't change, skipping sync")
+            return None
+
+        synced = await self.tree.sync(guild=guild)
+        self.hashes[scope] = digest
+        self.save()
+        return synced
+
+    async def sync_guilds(
+        self, guilds: Sequence[discord.abc.Snowflake], force: bool = False
+    ) -> Tuple[int, int, int]:
+        """Syncs the tree to every guild in `guilds` concurrently, as bulk traffic
+        through the dispatcher. Returns how many were synced, skipped and failed.
+        """
+        dispatcher = get_dispatcher()
+
+        async def sync(guild: discord.abc.Snowflake) -> str:
+            try:
+                synced = await dispatcher.run(
+                    ("application_commands", guild.id),
+                    lambda: self.sync(guild, force),
+                    Priority.BULK,
+                )
+            except discord.HTTPException:
+                return "failed"
+            return "skipped" if synced is None else "synced"
+
+        results = await asyncio.gather(*[sync(guild) for guild in guilds])
+        return (
+            results.count("synced"),
+            results.count("skipped"),
+            results.count("failed"),
+        )
@@ -1,7 +1,6 @@
-import youtube_dl, discord, asyncio
+import discord, asyncio, os, threading
 
-# suppress noise about console usage from errors
-youtube_dl.utils.bug_reports_message = lambda: ""
+from lib.ffmpeg import governor
 
 ytdl_format_options = {
     "format": "bestaudio/best",
@@ -18,9 +17,42 @@ ytdl_format_options = {
     "source_address": "0.0.0.0",
 }
 
-ffmpeg_options = {"options": "-vn"}
+_ytdl = None
+_ytdl_search = None
+_ytdl_lock = threading.Lock()
 
-ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+
+def get_ytdl(search=False):
+    """Returns the shared `YoutubeDL` instance (or the one for searches), importing
+    youtube_dl and creating them on first use, since that's slow. Usually called
+    from an executor thread.
+    """
+    global _ytdl, _ytdl_search
+    if _ytdl is None:
+        with _ytdl_lock:
+            if _ytdl is None:
+                import youtube_dl
+
+                # suppress noise about console usage from errors
+                youtube_dl.utils.bug_reports_message = lambda: ""
+
+                # only lists search results, without resolving every result's streams
+                _ytdl_search = youtube_dl.YoutubeDL(
+                    {**ytdl_format_options, "extract_flat": True}
+                )
+                _ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+    return _ytdl_search if search else _ytdl
+
+
+def _reset_ytdl():
+    # `YoutubeDL` instances hold open connections and cookie jars, so a forked
+    # process gets instances of its own instead of sharing its parent's
+    global _ytdl, _ytdl_search, _ytdl_lock
+    _ytdl = _ytdl_search = None
+    _ytdl_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_ytdl)
 
 
 class YTDLSource(discord.PCMVolumeTransformer):
@@ -31,21 +63,57 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.url = data.get("url")
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
+    async def extract(cls, url, *, loop=None, stream=False) -> dict:
+        """Resolves a url or search query to the data of a single track."""
         loop = loop or asyncio.get_event_loop()
 
         data = await loop.run_in_executor(
-            None, lambda: ytdl.extract_info(url, download=not stream)
+            None, lambda: get_ytdl().extract_info(url, download=not stream)
         )
 
         if "entries" in data:
             data = data["entries"][0]
 
-        filename = data["url"] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+        return data
+
+    @classmethod
+    async def search(cls, query, *, limit=5, loop=None) -> list:
+        """Searches youtube, returning `(title, url)` pairs of the top results."""
+        loop = loop or asyncio.get_event_loop()
+
+        data = await loop.run_in_executor(
+            None,
+            lambda: get_ytdl(search=True).extract_info(
+                f"ytsearch{limit}:{query}", download=False
+            ),
+        )
+
+        return [
+            (entry["title"], f"https://www.youtube.com/watch?v={entry['id']}")
+            for entry in data.get("entries", [])
+            if entry.get("title") and entry.get("id")
+        ]
 
     @classmethod
-    def from_file(cls, filename):
-        return cls(
-            discord.FFmpegPCMAudio(filename, **ffmpeg_options), data={"duration": 1}
+    async def from_data(cls, data, *, stream=False, gain_db=None, start=None):
+        """Creates a source from already extracted track data. `gain_db` is applied
+        by ffmpeg, e.g. for loudness normalization, and `start` (in seconds) seeks
+        into the track.
+        """
+        filename = data["url"] if stream else get_ytdl().prepare_filename(data)
+        # as an input option, ffmpeg seeks without decoding everything before `start`
+        before_options = f"-ss {start:.2f}" if start else None
+        options = f"-af volume={gain_db}dB" if gain_db else None
+        source = await governor.create(
+            filename, stream=stream, before_options=before_options, options=options
         )
+        return cls(source, data=data)
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None, stream=False, gain_db=None, start=None):
+        data = await cls.extract(url, loop=loop, stream=stream)
+        return await cls.from_data(data, stream=stream, gain_db=gain_db, start=start)
+
+    @classmethod
+    async def from_file(cls, filename):
+        return cls(await governor.create(filename), data={"duration": 1})